@@ -0,0 +1,180 @@
+'''Batch module for running the FSM_diff algorithm on many pairs of models with a process pool'''
+import csv
+import getopt
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from itertools import combinations
+from time import time
+
+from fsm import FSMDiff, TransitionIndex
+from settings import DiffConfig, SMT_SOLVERS, ITERATIVE_SOLVERS, EXACT_SOLVER, PORTFOLIO_SOLVER, AUTO_SOLVER
+from read_pairs import read_pairs
+from models import read_model
+from dot import write_dot
+from compact import COMPACT_EXTENSION
+
+SUMMARY_COLUMNS = ["Reference", "Updated", "precision", "recall", "f-measure", "Outgoing time", "Incoming time", "Scores wall-clock time", "Diff time", "Output"]
+
+_indices = {}
+
+
+def model_name(file):
+    '''Name of a model in the batch, the filename without directory and extension'''
+    return os.path.splitext(os.path.basename(file))[0]
+
+def all_pairs(names):
+    '''Every pair (ref, upd) with the reference before the updated model in names'''
+    return list(combinations(names, 2))
+
+def _init_worker(models):
+    '''Index every model once per worker process'''
+    _indices.clear()
+    for name, model in models.items():
+        _indices[name] = TransitionIndex(model)
+
+def _diff(reference, updated, config, output_file):
+    '''
+    Run one diff in a worker and write the annotated model
+
+    Returns
+    -------
+    The row of the summary table
+    '''
+    start_time = time()
+    result = FSMDiff().run(_indices[reference], _indices[updated], config)
+    diff_time = time() - start_time
+    graph = result.graph
+    for idx,val in {"Reference":reference, "Updated":updated, "Output":output_file}.items():
+        graph.graph.setdefault(idx,{})
+        graph.graph[idx]["Filename"] = val
+    write_dot(graph, output_file)
+
+    row = {column: graph.graph.get(column) for column in SUMMARY_COLUMNS}
+    row.update({"Reference": reference, "Updated": updated, "Diff time": diff_time, "Output": output_file})
+    return row
+
+def run_batch(files, pairs, config, output_dir, workers = None):
+    '''
+    Diff the given pairs of models, every model is parsed once and indexed once per worker
+
+    Parameters
+    ----------
+    files: list(str)
+        dot files of the models
+    pairs: list((str,str)), optional
+        (reference, updated) model names, all_pairs if None
+    config: DiffConfig
+        logging is always enabled, the log dict is used for the summary
+    output_dir: str
+        directory for the annotated models and summary.csv
+    workers: int, optional
+        number of worker processes, the number of cpus if None
+
+    Returns
+    -------
+    list of the rows of the summary table
+
+    Raises
+    ------
+    ValueError if two files have the same model name, e.g. m.dot and m.fsmc or v1/m.dot and v2/m.dot,
+    or a pair has a model that is not in the batch
+    '''
+    paths = {}
+    for file in files:
+        name = model_name(file)
+        if name in paths and os.path.abspath(paths[name]) != os.path.abspath(file):
+            # the pairs and the output files use the name, so it must be unique
+            raise ValueError("model name %s of %s is also the name of %s" % (name, file, paths[name]))
+        paths[name] = file
+    models = {name: read_model(file) for name, file in paths.items()}
+    if pairs is None:
+        pairs = all_pairs(list(models))
+    for reference, updated in pairs:
+        for name in (reference, updated):
+            if name not in models:
+                raise ValueError("model " + name + " is not in the batch")
+
+    config = replace(config, logging=True)
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(models,)) as executor:
+        futures = [executor.submit(_diff, reference, updated, config, os.path.join(output_dir, reference + "__" + updated + ".dot"))
+            for reference, updated in pairs]
+        rows = [future.result() for future in futures]
+
+    with open(os.path.join(output_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+def print_summary(rows):
+    '''Print the summary table to the terminal'''
+    columns = SUMMARY_COLUMNS[:-1]
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join(("%.4f" % row[c]) if isinstance(row[c], float) else str(row[c]) for c in columns))
+
+def main():
+    '''Main function for reading the commandline parameters and running the batch'''
+    config = DiffConfig()
+    files = []
+    pairs = None
+    output_dir = "output"
+    workers = None
+    try:
+        arguments = getopt.gnu_getopt(sys.argv[1:],"hs:k:t:r:o:j:",["help","smt=","k_value=","threshold=","ratio=","dir=","pairs=","out=","jobs=","live","scc","tol=","maxiter=","portfolio-stats="])
+
+        for current_arg, current_val in arguments[0]:
+            if current_arg in ("-s", "--smt"):
+                if current_val in SMT_SOLVERS or current_val in ITERATIVE_SOLVERS or current_val in ("umfpack", EXACT_SOLVER, PORTFOLIO_SOLVER, AUTO_SOLVER):
+                    config.solver = current_val
+                else:
+                    print("invalid smt-solver")
+                    return
+            elif current_arg in ("-k", "--k_value"):
+                config.k = float(current_val)
+            elif current_arg in ("-t", "--threshold"):
+                config.t = float(current_val)
+            elif current_arg in ("-r", "--ratio"):
+                config.r = float(current_val)
+            elif current_arg == "--dir":
+                files.extend(sorted(os.path.join(current_val, f) for f in os.listdir(current_val) if f.endswith((".dot", COMPACT_EXTENSION))))
+            elif current_arg == "--pairs":
+                pairs = read_pairs(current_val)
+            elif current_arg in ("-o", "--out"):
+                output_dir = current_val
+            elif current_arg in ("-j", "--jobs"):
+                workers = int(current_val)
+            elif current_arg == "--live":
+                config.live_pairs = True
+            elif current_arg == "--scc":
+                config.scc = True
+            elif current_arg == "--tol":
+                config.tolerance = float(current_val)
+            elif current_arg == "--maxiter":
+                config.max_iterations = int(current_val)
+            elif current_arg == "--portfolio-stats":
+                config.portfolio_stats = os.path.abspath(current_val)
+            elif current_arg in ("-h", "--help"):
+                print("Usage: batch.py [--dir=<directory with dot or compact models>] [<model> ...] [--pairs=<pairs file> (all pairs if not set)] [-o <output directory> -j <worker processes> -s <solver> -k <k value> -t <threshold value> -r <ratio value> --live --scc --tol=<tolerance> --maxiter=<max iterations> --portfolio-stats=<json file> (portfolio wins per system size for -s portfolio and -s auto)]")
+                print("The pairs file contains a reference:updated line per diff, with the model filenames without extension")
+                return
+        files.extend(arguments[1])
+    except getopt.error as err:
+        print(str(err))
+        return
+    if len(files) < 2:
+        print("At least two models needed")
+        return
+
+    try:
+        rows = run_batch(files, pairs, config, output_dir, workers)
+    except ValueError as err:
+        print(str(err))
+        return
+    print_summary(rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+'''
+Benchmark module for timing the FSM_diff algorithm on the bundled models and on synthetic models,
+per solver the median time of every phase and the peak memory are stored as JSON
+'''
+import getopt
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from statistics import median
+from time import perf_counter
+
+import networkx as nx
+import numpy as np
+import scipy
+
+from fsm import FSMDiff, DiffStatistics
+from settings import DiffConfig, SMT_SOLVERS, ITERATIVE_SOLVERS, EXACT_SOLVER
+from generator import model_pair
+from instrument import Profiler
+from models import read_model
+
+DOT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dot-files")
+BUNDLED_PAIRS = [("bowling", "pong"),
+    ("OpenSSL_1.0.1j_client_regular", "OpenSSL_1.0.1l_client_regular"),
+    ("OpenSSL_1.0.1g_client_regular", "OpenSSL_1.0.2_client_regular"),
+    ("OpenSSL_1.0.2_client_regular", "OpenSSL_1.0.2_client_full"),
+    ("TCP_Linux_Client", "TCP_Windows8_Client"),
+    ("TCP_FreeBSD_Client", "TCP_Linux_Client")]
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+# packages that main.py only loads when they are needed, see startup_cases
+HEAVY_MODULES = ("numpy", "scipy", "networkx", "pysmt", "z3")
+
+
+def environment():
+    '''The versions and the commit the benchmark ran on'''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+        "numpy": np.__version__, "scipy": scipy.__version__, "networkx": nx.__version__}
+
+def bundled_cases(directory = DOT_DIRECTORY):
+    '''
+    The pairs of bundled models
+
+    Returns
+    -------
+    Generator of (name, reference, updated, parse time, error), error is a string when a model cannot be read
+    '''
+    for reference, updated in BUNDLED_PAIRS:
+        name = reference + "__" + updated
+        start_time = perf_counter()
+        try:
+            models = [read_model(os.path.join(directory, model + ".dot")) for model in (reference, updated)]
+        except Exception as err:
+            yield name, None, None, None, "%s: %s" % (type(err).__name__, err)
+            continue
+        yield name, models[0], models[1], perf_counter() - start_time, None
+
+def synthetic_cases(sizes, alphabet_size, out_degree, mutation_rate, seed):
+    '''
+    Generated model pairs, the states of the updated model keep the name of the state they are mutated from
+
+    Returns
+    -------
+    Generator of (name, reference, updated, generation time, None)
+    '''
+    for size in sizes:
+        name = "synthetic_%d_states_%d_labels_degree_%d_mutation_%g" % (size, alphabet_size, out_degree, mutation_rate)
+        start_time = perf_counter()
+        reference, updated = model_pair(size, alphabet_size, out_degree, mutation_rate, seed)
+        yield name, reference, updated, perf_counter() - start_time, None
+
+def startup_cases(solvers, directory = DOT_DIRECTORY):
+    '''
+    The main.py command lines of which the startup is timed: --help and a diff of bowling and pong per solver
+
+    Returns
+    -------
+    list of (name, solver, arguments), solver is None for --help
+    '''
+    models = ["--ref=" + os.path.join(directory, "bowling.dot"), "--upd=" + os.path.join(directory, "pong.dot"),
+        "-o", os.path.join(tempfile.gettempdir(), "benchmark_startup.dot")]
+    return [("startup --help", None, ["--help"])] + [("startup bowling__pong", solver, models + ["-s", solver]) for solver in solvers]
+
+def imported_modules(arguments):
+    '''The HEAVY_MODULES a main.py run imports, from python -X importtime'''
+    stderr = subprocess.run([sys.executable, "-X", "importtime", MAIN] + arguments, capture_output=True, text=True).stderr
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:"):
+            module = line.rsplit("|", 1)[-1].strip().split(".")[0]
+            if module in HEAVY_MODULES:
+                modules.add(module)
+    return sorted(modules)
+
+def run_startup(solvers, repeats = 3, directory = DOT_DIRECTORY):
+    '''
+    Time main.py as a new process from start to exit, so that slower imports show up as a regression
+
+    Returns
+    -------
+    list of dicts with the median wall-clock time as total timer, the imported HEAVY_MODULES and the unexpected ones:
+    any for --help and pysmt or z3 for a solver that is not an SMT-solver
+    '''
+    rows = []
+    for name, solver, arguments in startup_cases(solvers, directory):
+        row = {"case": name, "solver": solver}
+        times = []
+        try:
+            for _ in range(repeats):
+                start_time = perf_counter()
+                subprocess.run([sys.executable, MAIN] + arguments, capture_output=True, check=True)
+                times.append(perf_counter() - start_time)
+        except subprocess.CalledProcessError as err:
+            row["error"] = err.stderr.decode(errors="replace").strip().splitlines()[-1:]
+            rows.append(row)
+            print("%s %s: %s" % (name, solver, row["error"]), file=sys.stderr)
+            continue
+        imported = imported_modules(arguments)
+        if solver is None:
+            unexpected = imported
+        elif solver in SMT_SOLVERS:
+            unexpected = []
+        else:
+            unexpected = [module for module in imported if module in ("pysmt", "z3")]
+        row.update({"timers": {"total": median(times)}, "imported": imported, "unexpected imports": unexpected})
+        rows.append(row)
+        print("%s %s %.4f s%s" % (name, solver or "", row["timers"]["total"],
+            " unexpected imports: " + ", ".join(unexpected) if unexpected else ""), file=sys.stderr)
+    return rows
+
+def run_case(reference, updated, solver, repeats, config):
+    '''
+    Diff one pair of models repeats times with a profiler and once more with tracemalloc for the peak memory
+
+    Returns
+    -------
+    dict with the median time of every phase, the counters, the peak memory and the precision/recall/f-measure
+
+    Raises
+    ------
+    ValueError if scores are not finite, e.g. umfpack on a singular system, the timings of such a run are not comparable
+    '''
+    runs = []
+    for _ in range(repeats):
+        profiler = Profiler()
+        run_config = DiffConfig(**{**config, "solver": solver, "logging": True})
+        start_time = perf_counter()
+        result = FSMDiff().algorithm(reference, updated, run_config, DiffStatistics(profiler=profiler))
+        profiler.timers["total"] = perf_counter() - start_time
+        runs.append(profiler)
+        non_finite = sum(1 for score in result.scores.values() if not math.isfinite(float(score)))
+        if non_finite:
+            raise ValueError("%d of %d scores are not finite" % (non_finite, len(result.scores)))
+
+    tracemalloc.start()
+    FSMDiff().algorithm(reference, updated, DiffConfig(**{**config, "solver": solver}))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timers = {name: median(run.timers.get(name, 0.0) for run in runs) for name in runs[0].timers}
+    k_pairs = result.k_pairs
+    row = {"timers": timers, "counters": runs[-1].counters, "peak memory (MB)": peak / (1024 * 1024)}
+    for column in ("precision", "recall", "f-measure"):
+        row[column] = float(result.graph.graph.get(column, 0))
+    # the synthetic states keep their names, so a k-pair is correct when both names are equal
+    row["identical k-pairs"] = sum(1 for s1, s2 in k_pairs if s1 == s2)
+    return row
+
+def run_benchmark(cases, solvers, repeats = 3, config = None, max_smt_states = 50, max_exact_states = 200):
+    '''
+    Run every case with every solver
+
+    Parameters
+    ----------
+    cases: iterable of (name, reference, updated, parse time, error)
+    solvers: list(str)
+    repeats: int
+        the phase times are the median of the repeats
+    config: dict, optional
+        DiffConfig fields for every run, e.g. {"k": 0.5, "live_pairs": True}
+    max_smt_states: int
+        the SMT-solvers are skipped for models with more states
+    max_exact_states: int
+        the exact solver is skipped for models with more states,
+        the fill-in of the exact elimination grows quickly on models without structure
+
+    Returns
+    -------
+    dict with the environment and a result per case and solver
+    '''
+    if config is None:
+        config = {}
+    results = []
+    for name, reference, updated, parse_time, error in cases:
+        if error is not None:
+            results.append({"case": name, "error": error})
+            print("%s: %s" % (name, error), file=sys.stderr)
+            continue
+        for solver in solvers:
+            entry = {"case": name, "solver": solver,
+                "states": [reference.number_of_nodes(), updated.number_of_nodes()],
+                "transitions": [reference.number_of_edges(), updated.number_of_edges()],
+                "load time": parse_time}
+            limit = max_smt_states if solver in SMT_SOLVERS else max_exact_states if solver == EXACT_SOLVER else None
+            if limit is not None and max(entry["states"]) > limit:
+                entry["skipped"] = "more than %d states" % limit
+            else:
+                try:
+                    entry.update(run_case(reference, updated, solver, repeats, config))
+                except Exception as err:
+                    entry["error"] = "%s: %s" % (type(err).__name__, err)
+            results.append(entry)
+            print("%s %s %s" % (name, solver, "%.4f s" % entry["timers"]["total"] if "timers" in entry
+                else entry.get("skipped", entry.get("error"))), file=sys.stderr)
+    return {"environment": environment(), "repeats": repeats, "config": config, "results": results}
+
+def compare(old, new, threshold = 0.1):
+    '''
+    Compare the total times of two benchmark results
+
+    Returns
+    -------
+    list of (case, solver, old time, new time, ratio, regression), regression is True
+    when the new time is more than threshold slower
+    '''
+    old_times = {(r["case"], r.get("solver")): r["timers"]["total"] for r in old["results"] if "timers" in r}
+    rows = []
+    for r in new["results"]:
+        key = (r["case"], r.get("solver"))
+        if "timers" in r and key in old_times:
+            ratio = r["timers"]["total"] / old_times[key]
+            rows.append((key[0], key[1], old_times[key], r["timers"]["total"], ratio, ratio > 1 + threshold))
+    return rows
+
+def parse_list(value, parse):
+    '''Parse a comma separated list'''
+    return [parse(v) for v in value.split(",")]
+
+def main():
+    '''Main function for reading the commandline parameters and running the benchmark'''
+    output_file = "benchmark.json"
+    solvers = ["umfpack", "bicgstab", EXACT_SOLVER]
+    repeats = 3
+    sizes = [50, 200, 1000]
+    alphabet_size = 10
+    out_degree = 3
+    mutation_rate = 0.05
+    seed = 0
+    bundled = True
+    synthetic = True
+    startup = True
+    config = {}
+    max_smt_states = 50
+    max_exact_states = 200
+    old_file = None
+    try:
+        arguments = getopt.gnu_getopt(sys.argv[1:],"ho:s:n:k:",["help","out=","solvers=","repeats=","sizes=","alphabet=","degree=",
+            "mutation=","seed=","no-bundled","no-synthetic","no-startup","live","scc","max-smt-states=","max-exact-states=","compare="])
+
+        for current_arg, current_val in arguments[0]:
+            if current_arg in ("-o", "--out"):
+                output_file = current_val
+            elif current_arg in ("-s", "--solvers"):
+                solvers = parse_list(current_val, str)
+                for solver in solvers:
+                    if not (solver in SMT_SOLVERS or solver in ITERATIVE_SOLVERS or solver in ("umfpack", EXACT_SOLVER)):
+                        print("invalid solver " + solver)
+                        return
+            elif current_arg in ("-n", "--repeats"):
+                repeats = int(current_val)
+            elif current_arg == "-k":
+                config["k"] = float(current_val)
+            elif current_arg == "--sizes":
+                sizes = parse_list(current_val, int)
+            elif current_arg == "--alphabet":
+                alphabet_size = int(current_val)
+            elif current_arg == "--degree":
+                out_degree = int(current_val)
+            elif current_arg == "--mutation":
+                mutation_rate = float(current_val)
+            elif current_arg == "--seed":
+                seed = int(current_val)
+            elif current_arg == "--no-bundled":
+                bundled = False
+            elif current_arg == "--no-synthetic":
+                synthetic = False
+            elif current_arg == "--no-startup":
+                startup = False
+            elif current_arg == "--live":
+                config["live_pairs"] = True
+            elif current_arg == "--scc":
+                config["scc"] = True
+            elif current_arg == "--max-smt-states":
+                max_smt_states = int(current_val)
+            elif current_arg == "--max-exact-states":
+                max_exact_states = int(current_val)
+            elif current_arg == "--compare":
+                old_file = current_val
+            elif current_arg in ("-h", "--help"):
+                print("Usage: benchmark.py [-o <output json> -s <comma separated solvers> -n <repeats> -k <k value> --live --scc --sizes=<comma separated state counts> --alphabet=<labels> --degree=<out-degree> --mutation=<mutation rate> --seed=<seed> --no-bundled --no-synthetic --no-startup --max-smt-states=<states> --max-exact-states=<states>]")
+                print("       benchmark.py --compare=<old json> <new json>")
+                return
+    except getopt.error as err:
+        print(str(err))
+        return
+
+    if old_file is not None:
+        if len(arguments[1]) != 1:
+            print("Give the new json file to compare with")
+            return
+        with open(old_file) as f:
+            old = json.load(f)
+        with open(arguments[1][0]) as f:
+            new = json.load(f)
+        print("case\tsolver\told\tnew\tratio")
+        for case, solver, old_time, new_time, ratio, regression in compare(old, new):
+            print("%s\t%s\t%.4f\t%.4f\t%.2f%s" % (case, solver, old_time, new_time, ratio, "\tREGRESSION" if regression else ""))
+        return
+
+    startup_rows = run_startup(solvers, repeats) if startup else []
+    cases = []
+    if bundled:
+        cases.append(bundled_cases())
+    if synthetic:
+        cases.append(synthetic_cases(sizes, alphabet_size, out_degree, mutation_rate, seed))
+    results = run_benchmark((case for generator in cases for case in generator), solvers, repeats, config, max_smt_states, max_exact_states)
+    results["results"] = startup_rows + results["results"]
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+'''
+Module for solving a score system block by block: a score only depends on the scores of its matched successor pairs,
+so the unknowns are split in the strongly connected components of these dependencies and the components are solved
+in topological order, with the scores that are already solved moved to the right-hand side
+'''
+from concurrent.futures import ThreadPoolExecutor
+import warnings
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import spsolve, MatrixRankWarning
+
+
+def condensation(matrix):
+    '''
+    The strongly connected components of the dependencies of a square matrix, unknown i depends on j if matrix[i, j] != 0
+
+    Returns
+    -------
+    Tuple of the component of every unknown and the level of every component,
+    a component only depends on components of a lower level, so the components of one level are independent
+    '''
+    nr_of_blocks, labels = connected_components(matrix, directed=True, connection="strong")
+    entries = matrix.tocoo()
+    between = labels[entries.row] != labels[entries.col]
+    # dependencies[a, b] is nonzero if component a depends on component b
+    dependencies = csr_matrix((np.ones(np.count_nonzero(between)), (labels[entries.row[between]], labels[entries.col[between]])),
+        shape=(nr_of_blocks, nr_of_blocks))
+    dependencies.sum_duplicates()
+    dependents = dependencies.tocsc()
+    remaining = np.diff(dependencies.indptr)
+    levels = np.full(nr_of_blocks, -1)
+    frontier = np.flatnonzero(remaining == 0)
+    level = 0
+    while len(frontier):
+        levels[frontier] = level
+        successors, counts = np.unique(dependents[:, frontier].indices, return_counts=True)
+        remaining[successors] -= counts
+        frontier = successors[remaining[successors] == 0]
+        level = level + 1
+    return labels, levels
+
+def block_solve(matrix, results, parallel = False):
+    '''
+    Solve matrix x = results per strongly connected component, see condensation.
+    The components of one pair are divided by their diagonal at once, the larger ones are solved with spsolve,
+    with parallel the larger components of a level are solved in threads
+
+    Returns
+    -------
+    Tuple of the solution, the number of components and the number of pairs of the largest component
+    '''
+    if len(results) == 0:
+        return np.zeros(0), 0, 0
+    labels, levels = condensation(matrix)
+    rows = matrix.tocsr()
+    diagonal = rows.diagonal()
+    sizes = np.bincount(labels)
+    # the unknowns ordered per level
+    unknown_levels = levels[labels]
+    order = np.argsort(unknown_levels, kind="stable")
+    bounds = np.searchsorted(unknown_levels[order], np.arange(levels.max() + 2))
+    solution = np.zeros(len(results))
+    if np.any((sizes[labels] == 1) & (diagonal == 0)):
+        # e.g. a pair of states without incoming transitions, its score is nan as with spsolve
+        warnings.warn("Matrix is exactly singular", MatrixRankWarning)
+
+    def solve(block, rhs):
+        return spsolve(rows[block][:, block].tocsc(), rhs)
+
+    executor = ThreadPoolExecutor() if parallel else None
+    try:
+        for level in range(len(bounds) - 1):
+            unknowns = order[bounds[level]:bounds[level + 1]]
+            # the unknowns of this level are still 0, they only add their own component
+            rhs = results[unknowns] - rows[unknowns] @ solution
+            single = sizes[labels[unknowns]] == 1
+            with np.errstate(divide="ignore", invalid="ignore"):
+                solution[unknowns[single]] = rhs[single] / diagonal[unknowns[single]]
+            if single.all():
+                continue
+            coupled = np.argsort(labels[unknowns[~single]], kind="stable")
+            block_unknowns = unknowns[~single][coupled]
+            block_rhs = rhs[~single][coupled]
+            splits = np.flatnonzero(np.diff(labels[block_unknowns])) + 1
+            blocks = np.split(block_unknowns, splits)
+            block_results = np.split(block_rhs, splits)
+            if executor is not None and len(blocks) > 1:
+                block_solutions = executor.map(solve, blocks, block_results)
+            else:
+                block_solutions = map(solve, blocks, block_results)
+            for block, block_solution in zip(blocks, block_solutions):
+                solution[block] = block_solution
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return solution, len(sizes), int(sizes.max())
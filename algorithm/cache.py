@@ -0,0 +1,136 @@
+'''Module with a persistent on-disk cache of the outgoing and incoming scores'''
+import hashlib
+import os
+import tempfile
+import zipfile
+from fractions import Fraction
+
+import numpy as np
+
+from settings import ITERATIVE_SOLVERS, PORTFOLIO_SOLVER
+
+
+def model_hash(fsm):
+    '''
+    Content hash of a model, independent of the order of the states and transitions in the dot file
+    '''
+    digest = hashlib.sha256()
+    for node in sorted(str(node) for node in fsm.nodes):
+        digest.update(node.encode() + b"\0")
+    digest.update(b"\1")
+    for edge in sorted((str(e[0]), str(e[1]), str(e[2]["label"])) for e in fsm.edges.data()):
+        digest.update("\0".join(edge).encode() + b"\1")
+    return digest.hexdigest()
+
+def score_key(fsm_1, fsm_2, k, matching_pairs, config):
+    '''
+    Cache key of the scores of two models, it combines the hashes of both models,
+    k, the solver, the raced solvers of the portfolio and the matching pairs
+    '''
+    digest = hashlib.sha256()
+    digest.update(model_hash(fsm_1).encode())
+    digest.update(model_hash(fsm_2).encode())
+    digest.update(repr((float(k), config.solver, config.live_pairs)).encode())
+    if config.solver in ITERATIVE_SOLVERS:
+        digest.update(repr((config.tolerance, config.max_iterations)).encode())
+    if config.solver == PORTFOLIO_SOLVER:
+        digest.update(repr(config.portfolio).encode())
+    if matching_pairs is not None:
+        digest.update(repr(sorted(matching_pairs)).encode())
+    return digest.hexdigest()
+
+class ScoreCache:
+    '''
+    Directory with the outgoing and incoming score vectors as .npz files,
+    the least recently used files are removed when the directory grows over max_bytes
+    '''
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        ''' File of a cache key '''
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key, fsm_1, fsm_2):
+        '''
+        Look up the scores of a key
+
+        Returns
+        -------
+        Tuple of the outgoing and incoming scores as dicts with the pairs as key
+        in the order of the states of fsm_1 and fsm_2, or None if the key is not cached.
+        Scores that were stored as Fractions are Fractions again
+        '''
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                states_1 = {str(s): i for i, s in enumerate(data["states_1"])}
+                states_2 = {str(s): i for i, s in enumerate(data["states_2"])}
+                outgoing = data["outgoing"]
+                incoming = data["incoming"]
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            # a damaged file, e.g. of a process that was killed, is a miss and is written again
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            # mark the file as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            pass
+        if outgoing.dtype.kind == "U":
+            outgoing = np.vectorize(Fraction, otypes=[object])(outgoing)
+            incoming = np.vectorize(Fraction, otypes=[object])(incoming)
+        outcome_out = {}
+        outcome_in = {}
+        for s1 in fsm_1.nodes:
+            for s2 in fsm_2.nodes:
+                i, j = states_1[str(s1)], states_2[str(s2)]
+                outcome_out[(s1,s2)] = outgoing[i, j]
+                outcome_in[(s1,s2)] = incoming[i, j]
+        return outcome_out, outcome_in
+
+    def put(self, key, fsm_1, fsm_2, outcome_out, outcome_in):
+        '''
+        Store the outgoing and incoming scores of a key and evict the least recently used files,
+        the Fractions of the exact solver are stored as strings so that they are not rounded
+        '''
+        states_1 = list(fsm_1.nodes)
+        states_2 = list(fsm_2.nodes)
+        exact = any(isinstance(score, Fraction) for score in outcome_out.values())
+        value = str if exact else float
+        outgoing = np.array([[value(outcome_out[(s1,s2)]) for s2 in states_2] for s1 in states_1]).reshape(len(states_1), len(states_2))
+        incoming = np.array([[value(outcome_in[(s1,s2)]) for s2 in states_2] for s1 in states_1]).reshape(len(states_1), len(states_2))
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            np.savez_compressed(f, states_1=np.array([str(s) for s in states_1]), states_2=np.array([str(s) for s in states_2]),
+                outgoing=outgoing, incoming=incoming)
+        os.replace(temporary, self.path(key))
+        self.evict()
+
+    def evict(self):
+        ''' Remove the least recently used files until the cache fits in max_bytes '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(entry[1] for entry in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total = total - size
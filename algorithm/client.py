@@ -0,0 +1,158 @@
+'''
+Client module for sending a diff to a running server.py, the options are the options of main.py.
+It only imports the standard library so that it starts fast
+'''
+import getopt
+import json
+import os
+import socket
+import sys
+import warnings
+
+from read_pairs import read_pairs
+from protocol import DEFAULT_SOCKET, DEFAULT_HOST, encode_message, decode_message
+
+
+def send_request(request, socket_path = DEFAULT_SOCKET, port = None, host = DEFAULT_HOST):
+    '''
+    Send one request to the server
+
+    Returns
+    -------
+    The response dict
+
+    Raises
+    ------
+    OSError if the server cannot be reached
+    '''
+    if port is None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socket_path)
+    else:
+        connection = socket.create_connection((host, port))
+    with connection, connection.makefile("rb") as reader:
+        connection.sendall(encode_message(request))
+        line = reader.readline()
+    if not line:
+        raise ConnectionError("the server closed the connection")
+    return decode_message(line)
+
+def main():
+    '''Main function for reading the commandline parameters and sending the diff to the server'''
+    config = {}
+    request = {}
+    matching_file = None
+    reference_filename = None
+    updated_filename = None
+    output_file = "out.dot"
+    profile_file = None
+    performance = False
+    inline = False
+    socket_path = DEFAULT_SOCKET
+    port = None
+    try:
+        arguments = getopt.getopt(sys.argv[1:],"lphs:k:t:r:m:o:",["log","performance","help","smt=","k_value=","threshold=","ratio=","matching-file=","ref=", "upd=", "out=", "live", "scc", "tol=", "maxiter=", "parallel", "cache=", "cache-size=", "profile=", "self-loops", "portfolio=", "portfolio-stats=", "socket=", "port=", "inline", "shutdown"])
+
+        for current_arg, current_val in arguments[0]:
+            if current_arg in ("-s", "--smt"):
+                config["solver"] = current_val
+            elif current_arg in ("-p", "--performance"):
+                performance = True
+            elif current_arg in ("-l", "--log"):
+                request["logging"] = True
+            elif current_arg in ("-k", "--k_value"):
+                config["k"] = float(current_val)
+            elif current_arg in ("-t", "--threshold"):
+                config["t"] = float(current_val)
+            elif current_arg in ("-r", "--ratio"):
+                config["r"] = float(current_val)
+            elif current_arg == "--tol":
+                config["tolerance"] = float(current_val)
+            elif current_arg == "--maxiter":
+                config["max_iterations"] = int(current_val)
+            elif current_arg == "--cache":
+                config["cache_dir"] = os.path.abspath(current_val)
+            elif current_arg == "--cache-size":
+                config["cache_size"] = int(float(current_val) * 1024 * 1024)
+            elif current_arg == "--parallel":
+                config["parallel"] = True
+            elif current_arg == "--live":
+                config["live_pairs"] = True
+            elif current_arg == "--scc":
+                config["scc"] = True
+            elif current_arg in ("-m","--matching-file"):
+                matching_file = current_val
+            elif current_arg == "--ref":
+                reference_filename = current_val
+            elif current_arg in ("-o", "--out"):
+                if current_val.split(".")[-1] == "dot":
+                    output_file = current_val
+                else:
+                    warnings.warn("output file needs to end on .dot, default out.dot is used instead")
+            elif current_arg == "--upd":
+                updated_filename = current_val
+            elif current_arg == "--profile":
+                profile_file = current_val
+            elif current_arg == "--self-loops":
+                request["self_loops"] = True
+            elif current_arg == "--portfolio":
+                config["portfolio"] = current_val.split(",")
+            elif current_arg == "--portfolio-stats":
+                config["portfolio_stats"] = os.path.abspath(current_val)
+            elif current_arg == "--socket":
+                socket_path = current_val
+            elif current_arg == "--port":
+                port = int(current_val)
+            elif current_arg == "--inline":
+                inline = True
+            elif current_arg == "--shutdown":
+                request["command"] = "shutdown"
+            elif current_arg in ("-h", "--help"):
+                print("Usage: client.py --ref=<reference dot model> --upd=<updated dot model> [-l (add logging in out file) -p (print the log) -o <output file> -s <solver> -k <k value> -t <threshold value> -r <ratio value> -m <matching file> --live --scc --tol=<tolerance> --maxiter=<max iterations> --parallel --cache=<score cache directory> --cache-size=<cache size in MB> --profile=<json file> (- for the terminal) --self-loops --portfolio=<comma separated solvers> --portfolio-stats=<json file> --inline (send the models instead of their paths) --socket=<unix socket> --port=<localhost port>]")
+                print("       client.py --shutdown [--socket=<unix socket> --port=<localhost port>]")
+                print("The options are the options of main.py, the diff runs in a running server.py")
+                return
+    except getopt.error as err:
+        print(str(err))
+        return
+
+    if request.get("command") != "shutdown":
+        if (not reference_filename or not updated_filename):
+            print("Model not set")
+            return
+        for name, filename in (("reference", reference_filename), ("updated", updated_filename)):
+            if inline:
+                with open(filename) as f:
+                    request[name + "_dot"] = f.read()
+            else:
+                # the server can run in another directory
+                request[name] = os.path.abspath(filename)
+        if matching_file is not None:
+            config["matching_pairs"] = read_pairs(matching_file)
+        request["config"] = config
+        request["profile"] = profile_file is not None
+        request["filenames"] = {"Reference": reference_filename, "Updated": updated_filename, "Output": output_file}
+
+    try:
+        response = send_request(request, socket_path, port)
+    except OSError as err:
+        print("server not reachable: " + str(err))
+        return
+    if "error" in response:
+        print(response["error"])
+        return
+    if request.get("command") == "shutdown":
+        return
+
+    with open(output_file, "w") as f:
+        f.write(response["dot"])
+    if performance:
+        print(response["log"])
+    if profile_file == "-":
+        print(json.dumps(response["profile"], indent=2))
+    elif profile_file is not None:
+        with open(profile_file, "w") as f:
+            json.dump(response["profile"], f, indent=2)
+
+if __name__ == "__main__":
+    main()
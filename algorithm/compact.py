@@ -0,0 +1,164 @@
+'''
+Module with a compact model representation backed by NumPy arrays
+
+The states and labels are interned as integers and the transitions are stored as
+source, target and label arrays sorted on source state (CSR order).
+A model can be written to and read from a memory-mappable binary file.
+'''
+import sys
+
+import numpy as np
+
+COMPACT_EXTENSION = ".fsmc"
+MAGIC = b"FSMC\x00\x00\x00\x01"
+
+
+class CompactEdges:
+    '''Read-only view on the transitions of a CompactFSM with the edges interface of networkx'''
+    def __init__(self, fsm):
+        self.fsm = fsm
+
+    def __len__(self):
+        return len(self.fsm.src)
+
+    def __iter__(self):
+        states = self.fsm.states
+        return ((states[s], states[d]) for s, d in zip(self.fsm.src.tolist(), self.fsm.dst.tolist()))
+
+    def data(self):
+        '''Iterate over the transitions as (source, target, {"label": label})'''
+        states = self.fsm.states
+        labels = self.fsm.labels
+        for s, d, l in zip(self.fsm.src.tolist(), self.fsm.dst.tolist(), self.fsm.label.tolist()):
+            yield (states[s], states[d], {"label": labels[l]})
+
+class CompactFSM:
+    '''
+    Model with the states and labels interned as integers
+
+    Attributes
+    ----------
+    states: list(str)
+        state names, the index is the state id
+    labels: list(str)
+        label names, the index is the label id
+    src, dst, label: np.ndarray
+        source, target and label id of every transition, sorted on source
+    offsets: np.ndarray
+        the transitions of state s are src[offsets[s]:offsets[s + 1]]
+    '''
+    def __init__(self, states, labels, src, dst, label):
+        self.states = list(states)
+        self.labels = list(labels)
+        self.state_ids = {state: i for i, state in enumerate(self.states)}
+        order = np.argsort(src, kind="stable")
+        self.src = np.asarray(src, dtype=np.int32)[order]
+        self.dst = np.asarray(dst, dtype=np.int32)[order]
+        self.label = np.asarray(label, dtype=np.int32)[order]
+        self.offsets = np.searchsorted(self.src, np.arange(len(self.states) + 1)).astype(np.int64)
+        self.graph = {}
+
+    @property
+    def nodes(self):
+        '''The states with the nodes interface of networkx: ordered iteration, len and in'''
+        return self.state_ids
+
+    @property
+    def edges(self):
+        '''The transitions with the edges interface of networkx'''
+        return CompactEdges(self)
+
+    @classmethod
+    def from_graph(cls, fsm):
+        '''Intern the states and labels of a nx.MultiDiGraph'''
+        states = list(fsm.nodes)
+        state_ids = {state: i for i, state in enumerate(states)}
+        label_ids = {}
+        src = []
+        dst = []
+        label = []
+        for edge in fsm.edges.data():
+            src.append(state_ids[edge[0]])
+            dst.append(state_ids[edge[1]])
+            label.append(label_ids.setdefault(edge[2]["label"], len(label_ids)))
+        return cls(states, list(label_ids), src, dst, label)
+
+    def to_graph(self):
+        '''Convert the model to a nx.MultiDiGraph'''
+        import networkx as nx
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(self.states)
+        graph.add_edges_from(self.edges.data())
+        return graph
+
+    def save(self, file):
+        '''
+        Write the model to a binary file:
+        magic, header, offsets, src, dst, label, name offsets and the utf-8 encoded names,
+        every array starts at a multiple of 8 bytes so it can be memory-mapped
+        '''
+        state_blob, state_offsets = _encode_names(self.states)
+        label_blob, label_offsets = _encode_names(self.labels)
+        header = np.array([len(self.states), len(self.labels), len(self.src), len(state_blob), len(label_blob)], dtype="<i8")
+        with open(file, "wb") as f:
+            f.write(MAGIC)
+            for array in (header, self.offsets.astype("<i8"), self.src.astype("<i4"), self.dst.astype("<i4"),
+                    self.label.astype("<i4"), state_offsets, label_offsets):
+                f.write(array.tobytes())
+                f.write(b"\0" * (-array.nbytes % 8))
+            f.write(state_blob)
+            f.write(label_blob)
+
+    @classmethod
+    def load(cls, file):
+        '''Read a model written by save, the transition arrays are memory-mapped'''
+        raw = np.memmap(file, dtype=np.uint8, mode="r")
+        if bytes(raw[:len(MAGIC)]) != MAGIC:
+            raise ValueError(file + " is not a compact model")
+        position = len(MAGIC)
+        def take(dtype, count):
+            nonlocal position
+            size = np.dtype(dtype).itemsize * count
+            array = raw[position:position + size].view(dtype)
+            position += size + (-size % 8)
+            return array
+        nr_of_states, nr_of_labels, nr_of_edges, state_blob_size, label_blob_size = take("<i8", 5).tolist()
+        offsets = take("<i8", nr_of_states + 1)
+        src = take("<i4", nr_of_edges)
+        dst = take("<i4", nr_of_edges)
+        label = take("<i4", nr_of_edges)
+        state_offsets = take("<i8", nr_of_states + 1)
+        label_offsets = take("<i8", nr_of_labels + 1)
+        states = _decode_names(bytes(raw[position:position + state_blob_size]), state_offsets)
+        position += state_blob_size
+        labels = _decode_names(bytes(raw[position:position + label_blob_size]), label_offsets)
+
+        fsm = cls.__new__(cls)
+        fsm.states = states
+        fsm.labels = labels
+        fsm.state_ids = {state: i for i, state in enumerate(states)}
+        fsm.src = src
+        fsm.dst = dst
+        fsm.label = label
+        fsm.offsets = offsets
+        fsm.graph = {}
+        return fsm
+
+def _encode_names(names):
+    '''Concatenate the utf-8 encoded names, with the start of every name in the offsets'''
+    encoded = [str(name).encode() for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    offsets[1:] = np.cumsum([len(name) for name in encoded])
+    return b"".join(encoded), offsets
+
+def _decode_names(blob, offsets):
+    '''Inverse of _encode_names'''
+    offsets = offsets.tolist()
+    return [blob[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: compact.py <dot model> <compact model" + COMPACT_EXTENSION + ">")
+        sys.exit(1)
+    from models import read_model
+    CompactFSM.from_graph(read_model(sys.argv[1])).save(sys.argv[2])
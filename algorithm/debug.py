@@ -1,11 +1,11 @@
 '''Debug module for printing SMT formula to terminal'''
 import sys
 
-import pysmt.smtlib.script
-
 
 def print_smtlib(formula):
     '''Function for printing the pysmt formula to readable output in terminal'''
+    # pysmt is only loaded when an SMT-solver is used
+    import pysmt.smtlib.script
     script = pysmt.smtlib.script.smtlibscript_from_formula(formula)
     script.serialize(sys.stdout, False)
 
@@ -0,0 +1,430 @@
+'''
+Module for reading and writing dot models without graphviz, for the subset of the dot language the models use:
+one digraph with node, edge and graph attribute statements, quoted, concatenated and HTML strings and multi-edges with a key.
+The output is laid out as graphviz writes it
+'''
+import re
+
+import networkx as nx
+
+SELF_LOOP_LABEL = "Self loop"
+KEYWORDS = ("node", "edge", "graph", "digraph", "subgraph", "strict")
+
+# a comment ends at the end of its line or at the first */, so that the regex cannot match a part of it.
+# As graphviz, a # outside a string starts a comment anywhere on a line, not only at the start
+_SPACE = r"(?:\s+|(?://|\#)[^\n]*(?:\n|\Z)|/\*(?:[^*]|\*(?!/))*\*/)*"
+# a plain id starts with a letter, _ or any non-ascii character, the classes exclude the other ascii characters
+# because a class of the non-ascii range takes long to compile.
+# A plain id may not be followed by a character of an id, so that the regex does not match a part of it
+_ID = (r"(?:[^\x00-\x40\x5b-\x5e\x60\x7b-\x7f][^\x00-\x2f\x3a-\x40\x5b-\x5e\x60\x7b-\x7f]*|-?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?))"
+    r"(?![^\x00-\x2d\x2f\x3a-\x40\x5b-\x5e\x60\x7b-\x7f])")
+_QUOTED = r'"((?:[^"\\]|\\.)*)"'
+# an HTML label without the outer brackets as learned models write it, <table ...>...</table>
+_TABLE = r"<(?P<tag>[A-Za-z][A-Za-z0-9_-]*)(?![A-Za-z0-9_-])[^<>]*>(?:(?!</(?P=tag)>).)*</(?P=tag)>"
+
+_SKIP = re.compile(_SPACE)
+_TOKEN = re.compile(_SPACE + r'''
+    (?:(?P<id>''' + _ID + r''')
+      |(?P<quoted>"(?:[^"\\]|\\.)*")
+      |(?P<html><)
+      |(?P<symbol>->|--|[{}\[\];,=:+])
+      |(?P<end>\Z))''', re.VERBOSE | re.DOTALL)
+# a node or a single edge with one attribute list, the statements of almost every model
+_STATEMENT = re.compile(_SPACE + r"(?:(?P<source>" + _ID + ")|" + _QUOTED.replace("(", "(?P<quoted_source>", 1) + r''')
+    \s*(?:->\s*(?:(?P<target>''' + _ID + ")|" + _QUOTED.replace("(", "(?P<quoted_target>", 1) + r''')\s*)?
+    (?:\[(?P<attributes>(?:[^\]"<]+|"(?:[^"\\]|\\.)*"|''' + _TABLE + r''')*)\]\s*)?
+    (?!''' + _SPACE + r'''[=:+\[-]);?''', re.VERBOSE | re.DOTALL)
+_ATTRIBUTE = re.compile(r"\s*(?:(?P<name>" + _ID + ")|" + _QUOTED.replace("(", "(?P<quoted_name>", 1) + r''')
+    \s*=\s*(?:(?P<value>''' + _ID + ")|" + _QUOTED.replace("(", "(?P<quoted_value>", 1) + "|(?P<html>" + _TABLE + r"))\s*[,;]?", re.VERBOSE | re.DOTALL)
+_ANGLE = re.compile(r"[<>]")
+_TAG = re.compile(r"[A-Za-z][A-Za-z0-9_-]*")
+_PLAIN_ID = re.compile(_ID + r"\Z")
+
+
+def read_dot(file, self_loops = False):
+    '''
+    Read a model from a dot file
+
+    Parameters
+    ----------
+    file: str
+    self_loops: bool
+        add a transition with the label "Self loop" to every state without incoming transitions,
+        as dot-files/fix-dot-files.py does, the umfpack solver needs an incoming transition per state
+
+    Returns
+    -------
+    nx.MultiDiGraph, transitions without a label get the empty label
+
+    Raises
+    ------
+    ValueError if the file is not in the supported subset of the dot language
+    '''
+    with open(file, encoding="utf-8") as f:
+        return parse_dot(f.read(), self_loops)
+
+def parse_dot(text, self_loops = False):
+    r'''
+    Read a model from the text of a dot file, see read_dot.
+    Comments are skipped as graphviz does, the examples run with python -m doctest dot.py
+
+    >>> def edges(text):
+    ...     return [(u, v, label) for u, v, label in parse_dot(text).edges(data="label")]
+    >>> edges('digraph { // c\n a -> b [label="x"] /* b -> c */ \n # hash\n}')
+    [('a', 'b', 'x')]
+    >>> edges('# top\ndigraph {\n\t# indented\n a /* in */ -> /* between */ b [/* attribute */ label="x" // end\n ]\n}')
+    [('a', 'b', 'x')]
+    >>> edges('digraph {\n a -> b [label="// /* # are not comments in a string"] # after a statement\n /* two\n lines -> c */ c -> a\n}')
+    [('a', 'b', '// /* # are not comments in a string'), ('c', 'a', '')]
+    >>> edges('digraph {\n a -> b /* not closed\n}')
+    Traceback (most recent call last):
+    ...
+    ValueError: line 2: invalid character '/'
+    '''
+    model = _Parser(text).parse()
+    if self_loops:
+        for state in [state for state, degree in model.in_degree() if degree == 0]:
+            model.add_edge(state, state, label=SELF_LOOP_LABEL)
+    return model
+
+def _tokens(text, position):
+    '''
+    The tokens of a dot text from position
+
+    Returns
+    -------
+    Generator of (kind, value, position), kind is "id" for a plain id, "string" for a quoted or HTML string,
+    the symbol itself for a symbol and "end" at the end of the text
+    '''
+    while True:
+        match = _TOKEN.match(text, position)
+        if match is None:
+            # the invalid character follows the spaces and comments
+            position = _SKIP.match(text, position).end()
+            raise ValueError("line %d: invalid character %r" % (_line(text, position), text[position]))
+        kind = match.lastgroup
+        position = match.end()
+        if kind == "id":
+            yield "id", match.group(kind), match.start(kind)
+        elif kind == "quoted":
+            yield "string", _unescape(match.group(kind)[1:-1]), match.start(kind)
+        elif kind == "html":
+            start = match.start(kind)
+            position, value = _html(text, start)
+            yield "string", value, start
+        elif kind == "symbol":
+            yield match.group(kind), None, match.start(kind)
+        else:
+            yield "end", None, position
+            return
+
+def _unescape(value):
+    '''The value of a quoted string, only \\" and line continuations are escapes in dot'''
+    if "\\" in value:
+        return value.replace("\\\n", "").replace('\\"', '"')
+    return value
+
+def _html(text, start):
+    '''
+    The HTML string starting at the < at start, without the outer brackets.
+    Learned models write HTML labels without the outer brackets, <table ...>...</table>,
+    such a string is kept as written up to the closing tag
+
+    Returns
+    -------
+    Tuple of the position after the string and its value
+    '''
+    depth = 0
+    position = start
+    while True:
+        match = _ANGLE.search(text, position)
+        if match is None:
+            raise ValueError("line %d: unterminated HTML string" % _line(text, start))
+        depth += 1 if match.group() == "<" else -1
+        position = match.end()
+        if depth == 0:
+            break
+    value = text[start + 1:position - 1]
+    tag = _TAG.match(value)
+    if tag is not None:
+        closing = text.find("</" + tag.group() + ">", position)
+        if closing != -1:
+            end = closing + len(tag.group()) + 3
+            return end, text[start:end]
+    return position, value
+
+def _line(text, position):
+    '''Line number of a position in the text'''
+    return text.count("\n", 0, position) + 1
+
+def _match_id(match, name):
+    '''The id of the group name or quoted_name of a match, None when it is not set or a keyword'''
+    value = match.group(name)
+    if value is not None:
+        return None if value.lower() in KEYWORDS else value
+    value = match.group("quoted_" + name)
+    return None if value is None else _unescape(value)
+
+def _attribute_list(text):
+    '''The attributes of the text between [ and ], None when it needs the full parser'''
+    attributes = {}
+    position = 0
+    for match in _ATTRIBUTE.finditer(text):
+        if match.start() != position:
+            return None
+        position = match.end()
+        name = _match_id(match, "name")
+        value = match.group("html") or _match_id(match, "value")
+        if name is None or value is None:
+            return None
+        attributes[name] = value
+    if text[position:].strip():
+        return None
+    return attributes
+
+class _Parser:
+    '''
+    Parser of one digraph, a node or single edge statement is matched as a whole by one regex,
+    any other statement is parsed from its tokens by recursive descent
+    '''
+    def __init__(self, text):
+        self.text = text
+        self.nodes = {}
+        self.edges = []
+        self.attributes = {}
+        self.defaults = {"graph": {}, "node": {}, "edge": {}}
+        # every label is stored once, equal labels are the same string
+        self.labels = {"": ""}
+        self.seek(0)
+
+    def seek(self, position):
+        '''Read the tokens from position'''
+        self.tokens = _tokens(self.text, position)
+        self.advance()
+
+    def advance(self):
+        '''Read the next token'''
+        self.kind, self.value, self.position = next(self.tokens)
+
+    def error(self, message):
+        raise ValueError("line %d: %s" % (_line(self.text, self.position), message))
+
+    def expect(self, kind):
+        if self.kind != kind:
+            self.error("expected %s" % kind)
+        self.advance()
+
+    def keyword(self):
+        '''The keyword of the current token, or None'''
+        if self.kind == "id" and self.value.lower() in KEYWORDS:
+            return self.value.lower()
+        return None
+
+    def identifier(self):
+        '''An id, quoted strings joined with + are concatenated'''
+        if self.kind not in ("id", "string") or self.keyword() is not None:
+            self.error("expected an id")
+        value = self.value
+        quoted = self.kind == "string"
+        self.advance()
+        while quoted and self.kind == "+":
+            self.advance()
+            if self.kind != "string":
+                self.error("expected a quoted string after +")
+            value += self.value
+            self.advance()
+        return value
+
+    def attribute_list(self):
+        '''One or more [name=value, ...] lists as dict'''
+        attributes = {}
+        while self.kind == "[":
+            self.advance()
+            while self.kind != "]":
+                name = self.identifier()
+                if self.kind == "=":
+                    self.advance()
+                    attributes[name] = self.identifier()
+                else:
+                    attributes[name] = "true"
+                if self.kind in (",", ";"):
+                    self.advance()
+            self.advance()
+        return attributes
+
+    def node(self, name):
+        '''The attributes of a node, the node is added with the node defaults when it is new'''
+        attributes = self.nodes.get(name)
+        if attributes is None:
+            attributes = self.nodes[name] = dict(self.defaults["node"])
+        return attributes
+
+    def parse(self):
+        '''Parse the digraph and build the model'''
+        if self.keyword() == "strict":
+            self.advance()
+        if self.keyword() != "digraph":
+            self.error("expected digraph, only directed models are supported")
+        self.advance()
+        name = self.identifier() if self.kind != "{" else ""
+        if self.kind != "{":
+            self.error("expected {")
+        position = self.position + 1
+        while True:
+            match = _STATEMENT.match(self.text, position)
+            if match is not None and self.matched_statement(match):
+                position = match.end()
+                continue
+            self.seek(position)
+            if self.kind == "}":
+                break
+            self.statement()
+            position = self.position
+        self.advance()
+        if self.kind != "end":
+            self.error("expected the end of the file")
+
+        model = nx.MultiDiGraph()
+        model.graph.update(self.attributes)
+        if name:
+            model.graph.setdefault("name", name)
+        for kind, defaults in self.defaults.items():
+            if defaults:
+                model.graph[kind] = defaults
+        model.add_nodes_from(self.nodes.items())
+        # graphviz orders the transitions of a state by the order of their target states, so does the model
+        order = {state: i for i, state in enumerate(self.nodes)}
+        self.edges.sort(key=lambda edge: order[edge[1]])
+        model.add_edges_from(self.edges)
+        return model
+
+    def matched_statement(self, match):
+        '''Add the node or edge of a _STATEMENT match, False when the statement needs the full parser'''
+        source = _match_id(match, "source")
+        if source is None:
+            return False
+        states = [source]
+        if match.group("target") is not None or match.group("quoted_target") is not None:
+            target = _match_id(match, "target")
+            if target is None:
+                return False
+            states.append(target)
+        attributes = {}
+        if match.group("attributes") is not None:
+            attributes = _attribute_list(match.group("attributes"))
+            if attributes is None:
+                return False
+        self.add(states, attributes)
+        return True
+
+    def statement(self):
+        '''One statement, a graph attribute, a default attribute list, a node or a chain of edges'''
+        if self.kind in (";", ","):
+            self.advance()
+            return
+        keyword = self.keyword()
+        if keyword in ("graph", "node", "edge"):
+            self.advance()
+            attributes = self.attribute_list()
+            self.defaults[keyword].update(attributes)
+            if keyword == "graph":
+                self.attributes.update(attributes)
+            return
+        if keyword == "subgraph" or self.kind == "{":
+            self.error("subgraphs are not supported")
+        name = self.identifier()
+        if self.kind == "=":
+            self.advance()
+            self.attributes[name] = self.defaults["graph"][name] = self.identifier()
+            return
+        if self.kind == ":":
+            self.error("ports are not supported")
+        if self.kind == "--":
+            self.error("undirected edges are not supported")
+        states = [name]
+        while self.kind == "->":
+            self.advance()
+            states.append(self.identifier())
+        self.add(states, self.attribute_list())
+
+    def add(self, states, attributes):
+        '''Add a node, or the edges of a chain of states with their key and interned label'''
+        if len(states) == 1:
+            self.node(states[0]).update(attributes)
+            return
+        for state in states:
+            self.node(state)
+        attributes = {**self.defaults["edge"], **attributes}
+        key = attributes.pop("key", None)
+        label = attributes.get("label", "")
+        attributes["label"] = self.labels.setdefault(label, label)
+        for source, target in zip(states, states[1:]):
+            self.edges.append((source, target, key, dict(attributes)))
+
+def write_dot(graph, file):
+    '''Write a graph as dot file'''
+    with open(file, "w", encoding="utf-8") as f:
+        f.writelines(dot_lines(graph))
+
+def to_dot(graph):
+    '''A graph as dot text'''
+    return "".join(dot_lines(graph))
+
+def dot_lines(graph):
+    '''
+    The lines of the dot text of a graph, in the order graphviz writes them:
+    the graph attributes, the defaults and per state its declaration and its outgoing transitions
+    in the order of their target states, a state is declared when it has attributes or no transitions.
+    Like graphviz, empty attribute values are left out and values as <...> are written as HTML strings
+
+    Returns
+    -------
+    Generator of str
+    '''
+    attributes = dict(graph.graph.get("graph", {}))
+    attributes.update((name, value) for name, value in graph.graph.items() if name not in ("graph", "node", "edge"))
+    yield "digraph %s {\n" % _quote(graph.graph.get("name", ""))
+    attributes = _attributes(sorted(attributes.items()))
+    if len(attributes) > 1:
+        yield "\tgraph [%s\n\t];\n" % ",\n\t\t".join(attributes)
+    elif attributes:
+        yield "\tgraph [%s];\n" % attributes[0]
+    for kind in ("node", "edge"):
+        defaults = _attributes(graph.graph.get(kind, {}).items())
+        if defaults:
+            yield "\t%s [%s];\n" % (kind, ",\n\t\t".join(defaults))
+
+    declared = set()
+    order = {state: i for i, state in enumerate(graph)}
+    for source, successors in graph.adjacency():
+        yield from _declaration(graph, source, declared)
+        for target, edges in sorted(successors.items(), key=lambda successor: order[successor[0]]):
+            yield from _declaration(graph, target, declared)
+            for key, data in edges.items():
+                attributes = ["key=" + _quote(key)] + _attributes(data.items())
+                yield "\t%s -> %s\t[%s];\n" % (_quote(source), _quote(target), ",\n\t\t".join(attributes))
+    yield "}\n"
+
+def _declaration(graph, state, declared):
+    '''The declaration of a state the first time it is written'''
+    if state in declared:
+        return
+    declared.add(state)
+    attributes = _attributes(graph.nodes[state].items())
+    if attributes:
+        yield "\t%s\t[%s];\n" % (_quote(state), ",\n\t\t".join(attributes))
+    elif graph.degree(state) == 0:
+        yield "\t%s;\n" % _quote(state)
+
+def _attributes(items):
+    '''The name=value strings of the non-empty attributes'''
+    return ["%s=%s" % (_quote(name), _quote(value)) for name, value in items if str(value) != ""]
+
+def _quote(value):
+    '''An id as graphviz writes it, quoted unless it is a plain id, a number or an HTML string'''
+    value = str(value)
+    if _PLAIN_ID.match(value) and value.lower() not in KEYWORDS:
+        return value
+    if value.startswith("<") and value.endswith(">"):
+        return value
+    return '"' + value.replace('"', '\\"') + '"'
@@ -0,0 +1,184 @@
+'''Module with an exact rational solver for the score systems of the FSM_Diff algorithm'''
+from fractions import Fraction
+from math import gcd
+import warnings
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+from scipy.sparse.linalg import spsolve
+
+# largest denominator of the rationals the float solution is rounded to
+MAX_DENOMINATOR = 10**6
+
+
+def exact_k(k):
+    '''The k-value as the rational that is written in decimals, e.g. 0.3 is 3/10'''
+    return Fraction(repr(float(k)))
+
+def integer_system(structure, k):
+    '''
+    Scale the score system of the live pairs to integer coefficients,
+    with k = p/q every row is multiplied by q:
+    q * denominator * x_i - p * (sum of the reached pairs x_j) = q * matched
+
+    The pairs without matched transitions have score 0 and are left out
+
+    Returns
+    -------
+    Tuple of the rows as {column: coefficient} dicts, the right hand side and the indices of the live pairs
+    '''
+    k = exact_k(k)
+    p, q = k.numerator, k.denominator
+    n = len(structure.denominator)
+    live = np.flatnonzero(structure.matched)
+    positions = np.full(n, -1)
+    positions[live] = np.arange(len(live))
+    positions = positions.tolist()
+    # number of matched transitions between every two pairs
+    couplings = csr_matrix((np.ones(len(structure.rows)), (structure.rows, structure.columns)), shape=(n, n))
+    indptr = couplings.indptr.tolist()
+    indices = couplings.indices.tolist()
+    counts = couplings.data.astype(np.int64).tolist()
+    denominator = structure.denominator.astype(np.int64).tolist()
+
+    rows = []
+    for i in live.tolist():
+        row = {positions[i]: q * denominator[i]}
+        for position in range(indptr[i], indptr[i + 1]):
+            j = positions[indices[position]]
+            if j >= 0:
+                row[j] = row.get(j, 0) - p * counts[position]
+        rows.append({j: c for j, c in row.items() if c != 0})
+    rhs = [q * m for m in structure.matched[live].astype(np.int64).tolist()]
+    return rows, rhs, live
+
+def _float_matrix(rows):
+    '''The integer rows as a csr matrix of floats'''
+    data = [float(c) for row in rows for c in row.values()]
+    columns = [j for row in rows for j in row]
+    pointers = np.cumsum([0] + [len(row) for row in rows])
+    return csr_matrix((data, columns, pointers), shape=(len(rows), len(rows)))
+
+def rounded_solution(rows, rhs):
+    '''
+    Solve the system in floats with umfpack and round the solution to rationals
+
+    Returns
+    -------
+    The rational solution if it solves the integer system exactly, which is the certificate, otherwise None
+    '''
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        approximation = spsolve(_float_matrix(rows).tocsc(), np.array(rhs, dtype=float))
+    approximation = np.atleast_1d(approximation)
+    if not np.all(np.isfinite(approximation)):
+        return None
+    solution = [Fraction(x).limit_denominator(MAX_DENOMINATOR) for x in approximation.tolist()]
+    for row, b in zip(rows, rhs):
+        if sum(c * solution[j] for j, c in row.items()) != b:
+            return None
+    return solution
+
+def eliminate(rows, rhs):
+    '''
+    Solve the integer system with fraction-free sparse Gaussian elimination
+
+    The systems are strictly diagonally dominant for k < 2, so the diagonal is the pivot
+    unless it became 0. The unknowns are eliminated in reverse Cuthill-McKee order to limit
+    the fill-in, and every updated row is divided by the gcd of its coefficients to keep the integers small.
+    Only the back substitution uses fractions
+
+    Returns
+    -------
+    The rational solution, or None if the system is singular
+    '''
+    rows = [dict(row) for row in rows]
+    rhs = list(rhs)
+    n = len(rows)
+    column_rows = [set() for _ in range(n)]
+    for r, row in enumerate(rows):
+        for j in row:
+            column_rows[j].add(r)
+    pattern = _float_matrix(rows)
+    order = reverse_cuthill_mckee((pattern + pattern.T).tocsr(), symmetric_mode=True).tolist()
+
+    pivots = []
+    for column in order:
+        candidates = column_rows[column]
+        if column in candidates:
+            pivot_row = column
+        elif candidates:
+            pivot_row = min(candidates, key=lambda r: len(rows[r]))
+        else:
+            return None
+        pivot = rows[pivot_row]
+        for j in pivot:
+            column_rows[j].discard(pivot_row)
+        a = pivot[column]
+        for r in list(column_rows[column]):
+            row = rows[r]
+            c = row[column]
+            g = gcd(a, c)
+            factor_row, factor_pivot = a // g, c // g
+            updated = {j: factor_row * v for j, v in row.items()}
+            for j, v in pivot.items():
+                updated[j] = updated.get(j, 0) - factor_pivot * v
+            b = factor_row * rhs[r] - factor_pivot * rhs[pivot_row]
+            for j in list(updated):
+                if updated[j] == 0:
+                    del updated[j]
+                    column_rows[j].discard(r)
+                elif j not in row:
+                    column_rows[j].add(r)
+            divisor = gcd(b, *updated.values())
+            if divisor > 1:
+                updated = {j: v // divisor for j, v in updated.items()}
+                b = b // divisor
+            rows[r] = updated
+            rhs[r] = b
+        pivots.append((pivot_row, column))
+
+    solution = [None] * n
+    for pivot_row, column in reversed(pivots):
+        row = rows[pivot_row]
+        total = Fraction(rhs[pivot_row])
+        for j, v in row.items():
+            if j != column:
+                total -= v * solution[j]
+        solution[column] = total / row[column]
+    return solution
+
+def exact_solve(structure, k):
+    '''
+    Solve a score system exactly over the rationals
+
+    The float solution is rounded to rationals first, which is exact for most models and
+    only needs the integer matrix-vector product as certificate, otherwise the system is eliminated exactly
+
+    Parameters
+    ----------
+    structure: ScoreStructure
+    k: float
+        k-value of the FSM_Diff algorithm, see exact_k
+
+    Returns
+    -------
+    Tuple of the scores as np.ndarray of Fractions in the order of the unknowns,
+    the number of live pairs and whether the rounded float solution was certified.
+    The scores are NaN if the system is singular
+    '''
+    rows, rhs, live = integer_system(structure, k)
+    scores = np.full(len(structure.denominator), Fraction(0), dtype=object)
+    if len(rows) == 0:
+        return scores, 0, True
+    solution = rounded_solution(rows, rhs)
+    certified = solution is not None
+    if not certified:
+        solution = eliminate(rows, rhs)
+    if solution is None:
+        warnings.warn("Matrix is exactly singular", Warning)
+        scores[live] = np.nan
+    else:
+        scores[live] = solution
+    return scores, len(rows), certified
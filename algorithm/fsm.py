@@ -1,29 +1,66 @@
 '''FSM module containing the FSM_diff algorithm'''
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 import string
-from typing import List, Tuple, Dict, final
+from typing import List, Tuple, Dict, Optional, Set, final
 from time import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import warnings
+import heapq
+import json
+from fractions import Fraction
 
-from pysmt.shortcuts import Symbol, And, Equals, GE, Plus, Minus, Times, Equals, Real, get_model
-from pysmt.typing import REAL
 import networkx as nx
 from scipy.sparse.linalg import spsolve
 import numpy as np
-from scipy.sparse import csc_matrix
+from scipy.sparse import csc_matrix, csr_matrix
 
 from debug import print_smtlib, write_k_pairs_to_file
+from system import (encode_models, score_structure, assemble_system, live_subsystem, score_matrix,
+    ScoreSystems, same_reference, changed_states, update_structure, transfer_solution)
+from settings import DiffConfig, ITERATIVE_SOLVERS, EXACT_SOLVER, PORTFOLIO_SOLVER, AUTO_SOLVER
+from iterative import iterative_solve
+from cache import ScoreCache, score_key
+from exact import exact_solve, integer_system
+from portfolio import race, record_wins, best_backend
+from blocks import block_solve
+from instrument import NULL_PROFILER
+
+# solver of FSMDiff.rediff when the configured solver is not iterative
+INCREMENTAL_SOLVER = "gmres"
 
-SMT_SOLVERS = ["msat","cvc4","z3","yices"]
+@dataclass
+class DiffStatistics:
+    '''This dataclass holds the measurements of one run of the FSM_Diff algorithm'''
+    out_time: Optional[float] = None
+    in_time: Optional[float] = None
+    out_size: Optional[Tuple[int,int]] = None
+    in_size: Optional[Tuple[int,int]] = None
+    out_iterations: Optional[int] = None
+    in_iterations: Optional[int] = None
+    scores_time: Optional[float] = None
+    cache_hit: Optional[bool] = None
+    out_changed: Optional[int] = None
+    in_changed: Optional[int] = None
+    out_construction: Optional[float] = None
+    in_construction: Optional[float] = None
+    out_winner: Optional[str] = None
+    in_winner: Optional[str] = None
+    # instrument.Profiler for the per-phase timers and counters, NULL_PROFILER records nothing
+    profiler: object = NULL_PROFILER
+
+    def record(self, out, **values):
+        '''Set the values of one direction, e.g. record(True, time=1) sets out_time'''
+        for name, value in values.items():
+            setattr(self, ("out_" if out else "in_") + name, value)
 
-current_solver = "umfpack"
-debug = False
-timing = False
-performance = False
-logging = False
-equation = False
-output_file = "out.txt"
-k_pairs_output = False
+@dataclass
+class DiffResult:
+    '''This dataclass holds the outcome of one run of the FSM_Diff algorithm'''
+    graph: nx.MultiDiGraph
+    scores: Dict[Tuple[str,str],float] = field(default_factory=dict)
+    k_pairs: Set[Tuple[str,str]] = field(default_factory=set)
+    statistics: DiffStatistics = field(default_factory=DiffStatistics)
+    systems: Optional[ScoreSystems] = None
 
 @dataclass
 class ComparingStates:
@@ -32,29 +69,54 @@ class ComparingStates:
     matching_trans: List[Tuple[Dict,Dict]]
     non_matching_trans: Tuple[List[Dict],List[Dict]]
 
-class Singleton(type):
-    '''This class is used to create a singleton instance of the FSM_Diff class'''
-    _instances = {}
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
-
-class FSMDiff(metaclass=Singleton):
-    '''This is singleton class which impelents the FSM_Diff algorithm'''
-
-    def __init__(self):
-        self.out_time = None
-        self.in_time = None
-
-    def pair_matching_transition(self,fsm_1,fsm_2,s1,s2,out):
+class TransitionIndex:
+    '''
+    Per-model index which maps every state to its outgoing and incoming
+    transitions grouped by label, so that transitions of a state can be
+    looked up without walking the edge list of the whole graph
+    '''
+    def __init__(self, fsm):
+        self.fsm = fsm
+        self.outgoing = {state: {} for state in fsm.nodes}
+        self.incoming = {state: {} for state in fsm.nodes}
+        for edge in fsm.edges.data():
+            self.outgoing[edge[0]].setdefault(edge[2]["label"], []).append(edge)
+            self.incoming[edge[1]].setdefault(edge[2]["label"], []).append(edge)
+
+    def transitions(self, state, out):
+        '''Return the label -> transitions dict of a state'''
+        return self.outgoing[state] if out else self.incoming[state]
+
+def smt_direction(encoded, k, out, matching_pairs, config):
+    '''
+    Solve one direction with an SMT-solver so that it can run in a worker process
+
+    Returns
+    -------
+    Tuple of the scores and a dict with the measurements of the direction for DiffStatistics.record
+    '''
+    statistics = DiffStatistics()
+    outcome = FSMDiff().linear_equation_solver_smt(encoded, k, out, matching_pairs, config, statistics)
+    prefix = "out_" if out else "in_"
+    return outcome, {name: getattr(statistics, prefix + name) for name in ("time", "construction", "size")}
+
+class FSMDiff:
+    '''
+    This class impelents the FSM_Diff algorithm
+    It holds no state, the settings are passed as DiffConfig and the measurements
+    are returned in the DiffResult, so one instance can run many diffs concurrently
+    '''
+
+    def pair_matching_transition(self,index_1,index_2,s1,s2,out):
         '''
         Match the transitions of a set of states
 
         Parameters
         ----------
-        fsm_1: nx.MultiDiGraph
-        fsm_2: nx.MultiDiGraph
+        index_1: TransitionIndex
+            Index of the reference fsm
+        index_2: TransitionIndex
+            Index of the updated fsm
         s1: str
             A state from fsm_1
         s2: str
@@ -67,42 +129,32 @@ class FSMDiff(metaclass=Singleton):
         -------
         Intsance of ComparingStates
         '''
-        used_trans1 = []
-        used_trans2 = []
         state_compare = ComparingStates((s1,s2),[],([],[]))
-        for t1 in fsm_1.edges.data():
-            if (t1[0] == s1 and out) or (t1[1] == s1 and not out):
-                used_trans1.append(t1)
-        for t2 in fsm_2.edges.data():
-            if (t2[0] == s2 and out) or (t2[1] == s2 and not out):
-                used_trans2.append(t2)
-
-        for t1 in used_trans1:
-            matched = False
-            for t2 in used_trans2:
-                if t1[2]["label"] == t2[2]["label"]:
-                    state_compare.matching_trans.append((t1,t2))
-                    matched = True
-            if not matched:
-                state_compare.non_matching_trans[0].append(t1)
-        for t2 in used_trans2:
-            matched = False
+        labels_1 = index_1.transitions(s1,out)
+        labels_2 = index_2.transitions(s2,out)
+
+        for label, used_trans1 in labels_1.items():
+            used_trans2 = labels_2.get(label)
+            if used_trans2 is None:
+                state_compare.non_matching_trans[0].extend(used_trans1)
+                continue
             for t1 in used_trans1:
-                if t1[2]["label"] == t2[2]["label"]:
-                    matched = True
-            if not matched:
-                state_compare.non_matching_trans[1].append(t2)
+                for t2 in used_trans2:
+                    state_compare.matching_trans.append((t1,t2))
+        for label, used_trans2 in labels_2.items():
+            if label not in labels_1:
+                state_compare.non_matching_trans[1].extend(used_trans2)
 
         return state_compare
 
-    def matching_transitions(self,fsm_1,fsm_2,out):
+    def matching_transitions(self,index_1,index_2,out):
         '''
         Run pair_matching_transition with all different pairs possible
         '''
         outcome = []
-        for s1 in fsm_1.nodes:
-            for s2 in fsm_2.nodes:
-                outcome.append(self.pair_matching_transition(fsm_1,fsm_2,s1,s2,out))
+        for s1 in index_1.fsm.nodes:
+            for s2 in index_2.fsm.nodes:
+                outcome.append(self.pair_matching_transition(index_1,index_2,s1,s2,out))
         return outcome
 
     def is_a_match(self, matching_pairs, t1, t2):
@@ -116,7 +168,7 @@ class FSMDiff(metaclass=Singleton):
                     return False
         return True # If the states are not listed in matching_pairs we pick normal K
 
-    def linear_equation_solver(self, state_pairs, k, out, matching_pairs = None):
+    def linear_equation_solver(self, state_pairs, k, out, matching_pairs, config, statistics):
         '''
         Solve the linear equation for the FSM_Diff algorithm
 
@@ -129,6 +181,11 @@ class FSMDiff(metaclass=Singleton):
         out: bool
             True if it must match on outgoing transitions,
             False if must match on incoming transitions
+        matching_pairs: list((str,str))
+            pairs that must be considered as match, or None
+        config: DiffConfig
+        statistics: DiffStatistics
+            the solve time of the direction is recorded in here
 
         Returns
         -------
@@ -143,115 +200,352 @@ class FSMDiff(metaclass=Singleton):
         state_pair_map = {}
         for i in range(0,len(state_pairs)):
             state_pair_map[state_pairs[i].states] = i
-        
-        row = 0
-        for state_pair in state_pairs:
+
+        # only the nonzero coefficients are stored, every row has the denominator
+        # on the diagonal and a -k entry for every matched successor pair
+        for row, state_pair in enumerate(state_pairs):
             denominator = 2 * (len(state_pair.matching_trans) + len(state_pair.non_matching_trans[0]) + len(state_pair.non_matching_trans[1]))
             matched_states = [((t1[1] if out else t1[0]),(t2[1] if out else t2[0])) for t1, t2 in state_pair.matching_trans]
 
-            equation = [0] * len(state_pairs)
-            equation[state_pair_map[state_pair.states]] = denominator
+            equation = {row: denominator}
             for matched_state in matched_states:
                 if (self.is_a_match(matching_pairs,matched_state[0],matched_state[1])):
-                    equation[state_pair_map[matched_state]] = equation[state_pair_map[matched_state]] -1 * k
+                    column = state_pair_map[matched_state]
+                    equation[column] = equation.get(column, 0) - 1 * k
 
-            columns = columns + list(range(0,len(state_pairs)))
-            rows = rows + ([row] * len(state_pairs))
+            rows.extend([row] * len(equation))
+            columns.extend(equation.keys())
+            equations.extend(equation.values())
 
-            row = row + 1
-
-            equations = equations + equation
             results.append(len(matched_states))
-            if debug:
+            if config.debug:
                 print(equation, " ",  len(matched_states))
 
-        matrix = csc_matrix((np.array(equations),(np.array(rows),np.array(columns))))
+        matrix = csc_matrix((np.array(equations, dtype=float),(np.array(rows),np.array(columns))), shape=(len(state_pairs),len(state_pairs)))
+        final_result = self.solve_system(matrix, np.array(results), out, config, statistics)
 
-        start_time = time()
-        final_result = spsolve(matrix,np.array(results))
-        if out:
-            self.out_time = (time() - start_time)
-        else:
-            self.in_time = (time() - start_time)
-        if timing:
-            print("%s seconds umfpack execution for " % self.out_time if out else self.in_time, end="")
-            print("outgoing transitions" if out else "incoming transitions")
-        
         return_dict = {}
         for i in range(0,len(final_result)):
             return_dict[state_pairs[i].states] = final_result[i]
         
         return return_dict
-        
 
-        
+    def linear_equation_solver_vectorized(self, encoded, k, out, matching_pairs, config, statistics, initial_guess = None, structure = None):
+        '''
+        Solve the linear equation for the FSM_Diff algorithm,
+        the system is built directly from the label count matrices of both models
+
+        Parameters
+        ----------
+        encoded: EncodedModels
+            Both models with the states and labels interned as integers
+        k: float
+            k-value of the FSM_Diff algorithm
+        out: bool
+            True if it must match on outgoing transitions,
+            False if must match on incoming transitions
+        matching_pairs: list((str,str))
+            pairs that must be considered as match, or None
+        config: DiffConfig
+        statistics: DiffStatistics
+            the solve time of the direction is recorded in here
+        initial_guess: np.ndarray, optional
+            start vector for the iterative solvers, ordered as encoded.pairs()
+        structure: ScoreStructure, optional
+            structure of the system, it is built from encoded if None
+
+        Returns
+        -------
+        Tuple of the ScoreStructure and the scores ordered as encoded.pairs()
+        '''
+        timer = ("outgoing" if out else "incoming") + " system"
+        if structure is None:
+            with statistics.profiler.timer(timer):
+                structure = score_structure(encoded, out, matching_pairs)
+        if config.solver == EXACT_SOLVER:
+            return structure, self.exact_solver(structure, k, out, config, statistics)
+        with statistics.profiler.timer(timer):
+            matrix, results = assemble_system(structure, k)
+        return structure, self.solve_system(matrix, results, out, config, statistics, initial_guess)
+
+    def score_systems(self, encoded, k, matching_pairs, config, statistics, initial_guess = None, structures = None):
+        '''
+        Build and solve the outgoing and incoming systems with the vectorized solver
+
+        initial_guess and structures are optional tuples of the outgoing and incoming
+        start vectors and structures, see linear_equation_solver_vectorized
+
+        Returns
+        -------
+        Instance of ScoreSystems
+        '''
+        guess_out, guess_in = (None, None) if initial_guess is None else initial_guess
+        structure_out, structure_in = (None, None) if structures is None else structures
+        system_out, system_in = self.solve_directions(ThreadPoolExecutor, config.parallel,
+            (self.linear_equation_solver_vectorized, encoded, k, True, matching_pairs, config, statistics, guess_out, structure_out),
+            (self.linear_equation_solver_vectorized, encoded, k, False, matching_pairs, config, statistics, guess_in, structure_in))
+        return ScoreSystems(encoded, matching_pairs, [system_out[0], system_in[0]], [system_out[1], system_in[1]])
+
+    def solve_system(self, matrix, results, out, config, statistics, initial_guess = None):
+        '''
+        Solve the sparse system with umfpack or one of the ITERATIVE_SOLVERS and record the time it takes
+        With live_pairs only the subsystem of the pairs with matched transitions is solved,
+        with scc umfpack solves the strongly connected components one by one
+        '''
+        direction = "outgoing" if out else "incoming"
+        total = len(results)
+        if config.live_pairs:
+            full_results = results
+            matrix, results, live = live_subsystem(matrix, results)
+            if initial_guess is not None:
+                initial_guess = np.asarray(initial_guess)[live]
+        statistics.profiler.count(direction + " nonzeros", matrix.nnz)
+        statistics.profiler.count(direction + " unknowns", len(results))
 
+        start_time = time()
+        iterations = None
+        blocks = None
+        with statistics.profiler.timer(direction + " solve"):
+            if len(results) == 0:
+                final_result = np.zeros(0)
+            elif config.solver in ITERATIVE_SOLVERS:
+                final_result, iterations = iterative_solve(config.solver, matrix, results, config.tolerance, config.max_iterations, initial_guess)
+            elif config.scc:
+                final_result, blocks, largest = block_solve(matrix, results, config.parallel)
+                statistics.profiler.count(direction + " blocks", blocks)
+                statistics.profiler.count(direction + " largest block", largest)
+            else:
+                final_result = spsolve(matrix,results)
+        solve_time = time() - start_time
+        statistics.record(out, time=solve_time, iterations=iterations, size=(len(results), total))
+        if config.timing:
+            print("%s seconds %s execution for %s transitions" % (solve_time, config.solver, "outgoing" if out else "incoming"))
+            if iterations is not None:
+                print("%d iterations" % iterations)
+            if blocks is not None:
+                print("%d strongly connected blocks, the largest has %d pairs" % (blocks, largest))
+            if config.live_pairs:
+                print("%d of %d pairs live for %s transitions" % (len(results), total, "outgoing" if out else "incoming"))
+
+        if config.live_pairs:
+            live_result = final_result
+            final_result = np.zeros(len(full_results))
+            final_result[live] = live_result
+        return final_result
+
+    def exact_solver(self, structure, k, out, config, statistics):
+        '''
+        Solve the system exactly over the rationals and record the time it takes, see exact.exact_solve
 
-    def linear_equation_solver_smt(self, state_pairs, k, out, matching_pairs = None):
+        Returns
+        -------
+        np.ndarray of Fractions
+        '''
+        if config.debug:
+            rows, rhs, _ = integer_system(structure, k)
+            for row, b in zip(rows, rhs):
+                print(row, " ", b)
+        start_time = time()
+        with statistics.profiler.timer(("outgoing" if out else "incoming") + " solve"):
+            final_result, nr_of_live, certified = exact_solve(structure, k)
+        solve_time = time() - start_time
+        statistics.profiler.count(("outgoing" if out else "incoming") + " unknowns", nr_of_live)
+        statistics.record(out, time=solve_time, size=(nr_of_live, len(final_result)))
+        if config.timing:
+            print("%s seconds %s execution for %s transitions (%s)" % (solve_time, config.solver, "outgoing" if out else "incoming",
+                "rounded float solution" if certified else "fraction-free elimination"))
+        return final_result
+
+    def linear_equation_solver_smt(self, encoded, k, out, matching_pairs, config, statistics):
         '''
         Solve the linear equation with SMT-solvers for the FSM_Diff algorithm
 
+        The equations are built from the vectorized system structure, with one symbol per pair.
+        Pairs without matched transitions have score 0, they get no symbol and their terms are left out,
+        as are the terms of excluded matches
+
         Parameters
         ----------
-        state_pairs: list(ComparingStates)
-            All matched and unmatched transitions for all the possible pairs
+        encoded: EncodedModels
+            Both models with the states and labels interned as integers
         k: float
             k-value of the FSM_Diff algorithm
         out: bool
             True if it must match on outgoing transitions,
             False if must match on incoming transitions
+        matching_pairs: list((str,str))
+            pairs that must be considered as match, or None
+        config: DiffConfig
+        statistics: DiffStatistics
+            the construction and solve time of the direction are recorded in here
 
         Returns
         -------
         Dictionary with the pairs as key and value as output
         '''
-        names = []
-        variables = []
-        domain = []
+        # pysmt and its solver shims are only loaded when an SMT-solver is used
+        from pysmt.shortcuts import Symbol, And, Equals, GE, Plus, Times, Real, get_model
+        from pysmt.typing import REAL
+
+        start_time = time()
+        structure = score_structure(encoded, out, matching_pairs)
+        n = len(structure.denominator)
+        live = np.flatnonzero(structure.matched)
+        positions = np.full(n, -1)
+        positions[live] = np.arange(len(live))
+        # number of matched transitions between every two pairs
+        couplings = csr_matrix((np.ones(len(structure.rows)), (structure.rows, structure.columns)), shape=(n, n))
+        pairs = encoded.pairs()
+        k = Fraction(k)
+
+        variables = [Symbol("(%s,%s)" % pairs[i], REAL) for i in live]
+        domain = [GE(variable, Real(0)) for variable in variables]
         equations = []
-        for state_pair in state_pairs:
-            names.append(state_pair.states)
-            variable = Symbol("(" + state_pair.states[0] + "," + state_pair.states[1] + ")", REAL)
-            variables.append(variable)
-            domain.append(GE(variable,Real(0.0)))
-            denominator = 2 * (len(state_pair.matching_trans) + len(state_pair.non_matching_trans[0]) + len(state_pair.non_matching_trans[1]))
-            matched_states = [((t1[1] if out else t1[0]),(t2[1] if out else t2[0])) for t1, t2 in state_pair.matching_trans]
-            reached_states_vars = [ Times(Real(k) if self.is_a_match(matching_pairs, t1, t2) else Real(0),Symbol("(" + t1 + "," + t2  + ")", REAL)) for (t1,t2) in matched_states]
-            times = Real(0) if len(reached_states_vars) < 1 else Plus(list(i for i in reached_states_vars))
-            equation = Equals(Minus(Times(Real(denominator), variable),  times), Real(len(state_pair.matching_trans)))
-            equations.append(equation)
-        formula = And(And( (i for i in domain)), And( (i for i in equations)))
-        if debug:
+        for i in live.tolist():
+            coefficients = {i: Fraction(int(structure.denominator[i]))}
+            for j, count in zip(couplings.indices[couplings.indptr[i]:couplings.indptr[i + 1]].tolist(),
+                    couplings.data[couplings.indptr[i]:couplings.indptr[i + 1]].tolist()):
+                if positions[j] >= 0:
+                    coefficients[j] = coefficients.get(j, 0) - k * int(count)
+            terms = [Times(Real(c), variables[positions[j]]) for j, c in coefficients.items() if c != 0]
+            equations.append(Equals(Plus(terms) if terms else Real(0), Real(int(structure.matched[i]))))
+        formula = And(domain + equations)
+        construction_time = time() - start_time
+        if config.debug:
             print_smtlib(formula)
+
         start_time = time()
-        model = get_model(formula, solver_name=current_solver)
-        if out:
-            self.out_time = (time() - start_time)
-        else:
-            self.in_time = (time() - start_time)
-        if timing:
-            print("%s seconds SMT execution for " % self.out_time if out else self.in_time, end="")
-            print("outgoing transitions" if out else "incoming transitions")
-        return_dict = {}
-        for i in range(0,len(names)):
-            return_dict[names[i]] = eval(str(model.get_value(variables[i])))
+        model = get_model(formula, solver_name=config.solver)
+        solve_time = time() - start_time
+        statistics.record(out, time=solve_time, construction=construction_time, size=(len(live), n))
+        if config.timing:
+            print("%s seconds SMT formula construction and %s seconds SMT execution for %s transitions" % (construction_time, solve_time, "outgoing" if out else "incoming"))
+
+        return_dict = dict.fromkeys(pairs, 0.0)
+        for i, variable in zip(live.tolist(), variables):
+            return_dict[pairs[i]] = float(model.get_value(variable).constant_value())
         return return_dict
 
-    def compute_scores(self,fsm_1, fsm_2, k, matching_pairs):
-        ''' Compute the scores for the different possible pairs '''
+    def direction_solver(self, solver_function, index_1, index_2, k, out, matching_pairs, config, statistics):
+        ''' Match the transitions of all pairs in one direction and solve them with solver_function '''
+        with statistics.profiler.timer(("outgoing" if out else "incoming") + " matching transitions"):
+            state_pairs = self.matching_transitions(index_1,index_2,out)
+        return solver_function(state_pairs, k, out, matching_pairs, config, statistics)
 
-        solver_function = self.linear_equation_solver if current_solver == "umfpack" else self.linear_equation_solver_smt
+    def solve_directions(self, executor_class, parallel, outgoing, incoming):
+        '''
+        Run the outgoing and incoming calls, given as (function, *arguments),
+        concurrently in an executor of executor_class when parallel is set
 
-        out_match_trans = self.matching_transitions(fsm_1,fsm_2,True)
-        outcome_out = solver_function(out_match_trans, k, True, matching_pairs)
+        Returns
+        -------
+        Tuple of the outgoing and incoming results
+        '''
+        if not parallel:
+            return outgoing[0](*outgoing[1:]), incoming[0](*incoming[1:])
+        with executor_class(max_workers=2) as executor:
+            future_out = executor.submit(*outgoing)
+            future_in = executor.submit(*incoming)
+            return future_out.result(), future_in.result()
+
+    def compute_scores(self,index_1, index_2, k, matching_pairs, config, statistics, initial_guess = None):
+        '''
+        Compute the scores for the different possible pairs, see compute_direction_scores
+        '''
+        outcome_out, outcome_in = self.compute_direction_scores(index_1, index_2, k, matching_pairs, config, statistics, initial_guess)
+        return self.combine_scores(outcome_out, outcome_in, config)
 
-        in_match_trans = self.matching_transitions(fsm_1,fsm_2,False)
-        outcome_in = solver_function(in_match_trans, k, False, matching_pairs)
+    def compute_direction_scores(self,index_1, index_2, k, matching_pairs, config, statistics, initial_guess = None):
+        '''
+        Compute the outgoing and incoming scores for the different possible pairs
+        With parallel the outgoing and incoming systems are solved concurrently,
+        in threads for the numeric solvers and in processes for the SMT-solvers
+
+        initial_guess is an optional tuple of the outgoing and incoming start vectors
+        for the iterative solvers, ordered as EncodedModels.pairs()
+        '''
+        numeric = config.solver == "umfpack" or config.solver in ITERATIVE_SOLVERS
+
+        start_time = time()
+        if config.solver == PORTFOLIO_SOLVER:
+            outcome_out, outcome_in = self.portfolio_scores(self.encode(index_1, index_2, statistics), k, matching_pairs, config, statistics)
+        elif self.vectorized(config):
+            systems = self.score_systems(self.encode(index_1, index_2, statistics), k, matching_pairs, config, statistics, initial_guess)
+            outcome_out, outcome_in = systems.scores()
+        elif numeric:
+            outcome_out, outcome_in = self.solve_directions(ThreadPoolExecutor, config.parallel,
+                (self.direction_solver, self.linear_equation_solver, index_1, index_2, k, True, matching_pairs, config, statistics),
+                (self.direction_solver, self.linear_equation_solver, index_1, index_2, k, False, matching_pairs, config, statistics))
+        else:
+            # the measurements are taken in the worker processes
+            encoded = self.encode(index_1, index_2, statistics)
+            (outcome_out, values_out), (outcome_in, values_in) = self.solve_directions(ProcessPoolExecutor, config.parallel,
+                (smt_direction, encoded, k, True, matching_pairs, config),
+                (smt_direction, encoded, k, False, matching_pairs, config))
+            statistics.record(True, **values_out)
+            statistics.record(False, **values_in)
+        self.record_scores_time(start_time, config, statistics)
+        return outcome_out, outcome_in
+
+    def portfolio_scores(self, encoded, k, matching_pairs, config, statistics):
+        '''
+        Solve both directions with the portfolio of config.portfolio, see portfolio.race,
+        and add the winners to the statistics file of config.portfolio_stats
 
+        Returns
+        -------
+        Tuple of the outgoing and incoming scores as dicts with the pairs as key
+        '''
+        with statistics.profiler.timer("portfolio"):
+            (scores_out, values_out), (scores_in, values_in) = race(encoded, k, matching_pairs, config, config.portfolio)
+        statistics.record(True, **values_out)
+        statistics.record(False, **values_in)
+        if config.portfolio_stats is not None:
+            record_wins(config.portfolio_stats, len(scores_out), [values_out["winner"], values_in["winner"]])
+        if config.timing:
+            for out, values in ((True, values_out), (False, values_in)):
+                print("%s seconds %s won the portfolio for %s transitions" % (values["time"], values["winner"], "outgoing" if out else "incoming"))
+        pairs = encoded.pairs()
+        return dict(zip(pairs, scores_out.tolist())), dict(zip(pairs, scores_in.tolist()))
+
+    def resolve_solver(self, index_1, index_2, config):
+        ''' Replace AUTO_SOLVER by the backend that won the portfolio most often for the number of pairs '''
+        if config.solver != AUTO_SOLVER:
+            return config
+        nr_of_pairs = len(index_1.fsm.nodes) * len(index_2.fsm.nodes)
+        return replace(config, solver=best_backend(config.portfolio_stats, nr_of_pairs, config.portfolio))
+
+    def encode(self, index_1, index_2, statistics):
+        ''' Intern the states and labels of both models, see system.encode_models '''
+        with statistics.profiler.timer("encode"):
+            encoded = encode_models(index_1.fsm, index_2.fsm)
+        statistics.profiler.count("pairs", len(encoded.states_1) * len(encoded.states_2))
+        return encoded
+
+    def vectorized(self, config):
+        '''
+        True if the scores are computed with the vectorized solver, it does not create a
+        ComparingStates object per pair, debug mode keeps the per pair path to print every equation
+        except for the exact solver, which prints its integer rows
+        '''
+        if config.solver == EXACT_SOLVER:
+            return True
+        return (config.solver == "umfpack" or config.solver in ITERATIVE_SOLVERS) and not config.debug
+
+    def record_scores_time(self, start_time, config, statistics):
+        ''' Record the wall-clock time of both directions since start_time '''
+        statistics.scores_time = time() - start_time
+        if config.timing:
+            print("%s seconds wall-clock time for both directions" % statistics.scores_time)
+
+    def combine_scores(self, outcome_out, outcome_in, config):
+        ''' Average the outgoing and incoming scores of every pair '''
         result_dict = {}
         for var in outcome_out.keys():
             result_dict[var] = (outcome_out[var] + outcome_in[var]) / 2
-        if equation:
+        if config.equation and config.solver == EXACT_SOLVER:
+            print({var: str(score) for var, score in result_dict.items()})
+        elif config.equation:
             print(result_dict)
         return result_dict
 
@@ -274,25 +568,31 @@ class FSMDiff(metaclass=Singleton):
         -------
         set of k_pairs (landmarks)
         '''
-        filtered_dict = {}
-        vars = []
-        for var in pairs_to_scores:
-            vars.append(var)
-            if pairs_to_scores[var] >= t:
-                filtered_dict[var] = pairs_to_scores[var]
-        landmarks = set()
-        for var in vars:
-            filtered_vars = list(filter(lambda v: v[0] ==var[0] and not v == var, vars))
-            is_landmark = True
-            for f_var in filtered_vars:
-                if not (pairs_to_scores[var] >= (pairs_to_scores[f_var] * r) and var in filtered_dict):
-                    is_landmark = False
-            if is_landmark:
-                landmarks.add(var)
+        states_1, states_2, scores = score_matrix(pairs_to_scores)
+        if len(states_2) == 1:
+            # without other pairs for the same state there is nothing to compare with
+            return set(pairs_to_scores)
+        rows = np.arange(len(states_1))
+
+        # highest and lowest score of the other pairs of the same reference state
+        best = np.argmax(scores, axis=1)
+        worst = np.argmin(scores, axis=1)
+        masked = scores.copy()
+        masked[rows, best] = -np.inf
+        other_max = np.where(np.arange(len(states_2)) == best[:, None], masked.max(axis=1)[:, None], scores[rows, best][:, None])
+        masked = scores.copy()
+        masked[rows, worst] = np.inf
+        other_min = np.where(np.arange(len(states_2)) == worst[:, None], masked.min(axis=1)[:, None], scores[rows, worst][:, None])
+
+        # score >= r * score of every other pair of the same reference state
+        other_bound = other_max * r if r >= 0 else other_min * r
+        with np.errstate(invalid="ignore"):
+            is_landmark = (scores >= t) & (scores >= other_bound)
+        landmarks = set((states_1[i], states_2[j]) for i, j in np.argwhere(is_landmark))
         return landmarks
 
 
-    def surrounding_pairs(self, fsm_1,fsm_2,pair):
+    def surrounding_pairs(self, index_1,index_2,pair):
         '''
         From a matced pair, calculate next pair of state which can be reached
         by a matched transition
@@ -301,139 +601,170 @@ class FSMDiff(metaclass=Singleton):
         s2 = pair[1]
 
         n_pair = set()
-        out_matching = self.pair_matching_transition(fsm_1,fsm_2,s1,s2,True)
-        for t_out1, t_out2 in out_matching.matching_trans:
-            n_pair.add(  (t_out1[1] , t_out2[1]))
-        in_matching = self.pair_matching_transition(fsm_1,fsm_2,s1,s2,False)
-        for t_in1, t_in2 in in_matching.matching_trans:
-            n_pair.add( (t_in1[0], t_in2[0]))
+        out_2 = index_2.outgoing[s2]
+        for label, trans1 in index_1.outgoing[s1].items():
+            for t_out1 in trans1:
+                for t_out2 in out_2.get(label,()):
+                    n_pair.add(  (t_out1[1] , t_out2[1]))
+        in_2 = index_2.incoming[s2]
+        for label, trans1 in index_1.incoming[s1].items():
+            for t_in1 in trans1:
+                for t_in2 in in_2.get(label,()):
+                    n_pair.add( (t_in1[0], t_in2[0]))
         return n_pair
 
-    def pick_highest(self, n_pairs, pairs_to_scores):
-        '''
-        Pick the highest score from the set
+    def extend_k_pairs(self, index_1, index_2, k_pairs, pairs_to_scores, profiler = NULL_PROFILER):
         '''
-        highest =  ("", -0.0)
-        for pair in n_pairs:
-            if pairs_to_scores[pair] >= highest[1]:
-                highest = (pair, pairs_to_scores[pair])
-        return highest[0]
+        Extend the k_pairs with the surrounding pairs, highest score first (line 6 - 14)
 
-    def remove_conflicts(self,n_pairs, pair):
+        Every round the surrounding pairs of the pairs added in the previous round form
+        the candidates, the surrounding pairs of older pairs are already matched or in conflict.
+        The candidates are kept in a max-heap on score, a candidate is dropped lazily when it is popped
+        and one of its states is already matched. Equal scores are picked in order of the pair.
+        The number of rounds, the number of candidates and the largest frontier are counted in the profiler
         '''
-        Prevent duplication in the list by removing a pair
-        if one of the states is already matched
+        matched_1 = {pair[0] for pair in k_pairs}
+        matched_2 = {pair[1] for pair in k_pairs}
+        new_pairs = list(k_pairs)
+        rounds = 0
+        nr_of_candidates = 0
+        largest_frontier = 0
+        while new_pairs:
+            # line 6 / 13
+            candidates = set()
+            for pair in new_pairs:
+                for n_pair in self.surrounding_pairs(index_1,index_2,pair):
+                    if n_pair[0] not in matched_1 and n_pair[1] not in matched_2:
+                        candidates.add(n_pair)
+            heap = [(-self.heap_score(pairs_to_scores[n_pair]), n_pair) for n_pair in candidates]
+            heapq.heapify(heap)
+            rounds += 1
+            nr_of_candidates += len(heap)
+            largest_frontier = max(largest_frontier, len(heap))
+
+            # line 8 - 12
+            new_pairs = []
+            while heap:
+                # line 9
+                pair = heapq.heappop(heap)[1]
+                # line 11
+                if pair[0] in matched_1 or pair[1] in matched_2:
+                    continue
+                # line 10
+                k_pairs.add(pair)
+                matched_1.add(pair[0])
+                matched_2.add(pair[1])
+                new_pairs.append(pair)
+        profiler.count("matching loop rounds", rounds)
+        profiler.count("matching loop candidates", nr_of_candidates)
+        profiler.peak("largest frontier", largest_frontier)
+        return k_pairs
+
+    def heap_score(self, score):
+        ''' Score used for ordering the candidates, a score that could not be computed is picked last '''
+        # score != score is only True for nan, it also works for the Fractions of the exact solver
+        return -np.inf if score != score else score
+
+    def transition_differences(self, index_1, index_2, k_pairs):
         '''
-        new_n_pairs = set()
-        for n_pair in n_pairs:
-            if pair[0] != n_pair[0] and pair[1] != n_pair[1]:
-                new_n_pairs.add(n_pair)
-        return new_n_pairs
+        Calculate the added, removed and matched transitions with one hash join
 
-    def added_transitions(self, fsm_1, fsm_2, k_pairs):
-        '''
-        calculate the transitions that are added
-        i.e that are not in fsm_1 but in fsm_2
-        '''
-        added_transitions = []
-        for edge2 in fsm_2.edges.data():
-            exists = False
-            for edge1 in fsm_1.edges.data():
-                if (edge1[0],edge2[0]) in k_pairs and (edge1[1],edge2[1]) in k_pairs and edge2[2]["label"] == edge1[2]["label"]:
-                    exists = True
-            if not exists:
-                added_transitions.append(edge2)
-        return added_transitions
+        Every reference transition is keyed by the partners of its source and target state
+        and its label, an updated transition with the same key is matched to it.
+        Added transitions are in fsm_2 but have no match, removed transitions are in fsm_1 but have no match.
 
-    def removed_transitions(self, fsm_1, fsm_2, k_pairs):
-        '''
-        calculate the transitions that are removed
-        i.e that are in fsm_1 but not in fsm_2
+        Returns
+        -------
+        Tuple of the added transitions, the removed transitions and the matched transitions
+        as (from_state, to_state, label) of the output graph
         '''
-        removed_transitions = []
-        for edge1 in fsm_1.edges.data():
-            exists = False
-            for edge2 in fsm_2.edges.data():
-                if (edge1[0],edge2[0]) in k_pairs and (edge1[1],edge2[1]) in k_pairs and edge2[2]["label"] == edge1[2]["label"]:
-                    exists = True
-            if not exists:
-                removed_transitions.append(edge1)
-        return removed_transitions
+        k_list = list(k_pairs)
+        positions = {pair: i for i, pair in enumerate(k_list)}
+        partners = {}
+        for s1, s2 in k_list:
+            partners.setdefault(s1,[]).append(s2)
+
+        edges_1 = list(index_1.fsm.edges.data())
+        keyed = {}
+        for i, edge1 in enumerate(edges_1):
+            for from_partner in partners.get(edge1[0],()):
+                for to_partner in partners.get(edge1[1],()):
+                    keyed.setdefault((from_partner, to_partner, edge1[2]["label"]),[]).append(i)
+
+        added = []
+        matched = []
+        matched_1 = set()
+        for edge2 in index_2.fsm.edges.data():
+            label = edge2[2]["label"]
+            hits = keyed.get((edge2[0], edge2[1], label))
+            if hits is None:
+                added.append(edge2)
+                continue
+            for i in hits:
+                matched_1.add(i)
+                from_state = self.fresh_var(positions[(edges_1[i][0],edge2[0])])
+                to_state = self.fresh_var(positions[(edges_1[i][1],edge2[1])])
+                matched.append((from_state,to_state,label))
+        removed = [edge1 for i, edge1 in enumerate(edges_1) if i not in matched_1]
+        return added, removed, matched
 
     def fresh_var(self,index):
-        '''Generate a fresh variable on basis of the given index'''
+        '''Generate a fresh variable on basis of the given index: a, b, ..., z, aa, ab, ..., zz, aaa, ...'''
         letters = string.ascii_lowercase
-        value = 1
-        if index >= len(letters):
-            value = int(index / len(letters)) + 1
-            index = index % len(letters)
-        return letters[index] * value
-
-
-    def annotade_edges(self,graph,k_pairs,set_edges,color, index, nr_of_states):
+        name = letters[index % len(letters)]
+        index = index // len(letters)
+        while index > 0:
+            index = index - 1
+            name = letters[index % len(letters)] + name
+            index = index // len(letters)
+        return name
+
+    def annotade_edges(self,graph,state_nodes,set_edges,color, index, nr_of_states):
         '''
         Annotade edges by a color
-        Check if the state is already in the graph and otherwise create a new fresh node
+        Look up the node of the state in state_nodes and otherwise create a new fresh node,
+        the original state name is kept as ref (index 0) or upd (index 1) attribute
         Return how many nodes there are already in the model
         '''
         added_dict = {}
+        attribute = "ref" if index == 0 else "upd"
         for add in set_edges:
-            from_state = None
-            for k in k_pairs:
-                if k[index] == add[0]:
-                    from_state = self.fresh_var(k_pairs.index(k))
-            if from_state is None and add[0] in added_dict.keys():
-                from_state = self.fresh_var(added_dict[add[0]])
-            elif from_state is None:
-                num = nr_of_states + len(added_dict)
-                from_state = self.fresh_var(num)
-                added_dict[add[0]] = num
-                graph.add_node(from_state,color=color)
-
-            to_state = None
-            for k in k_pairs:
-                if k[index] == add[1]:
-                    to_state = self.fresh_var(k_pairs.index(k))
-            if to_state is None and add[1] in added_dict.keys():
-                to_state = self.fresh_var(added_dict[add[1]])
-            elif to_state is None:
-                num = nr_of_states + len(added_dict)
-                to_state = self.fresh_var(num)
-                added_dict[add[1]] = num
-                graph.add_node(to_state,color=color)
-
-            graph.add_edge(from_state,to_state,color=color,label=add[2]["label"])
+            nodes = []
+            for state in (add[0], add[1]):
+                node = state_nodes.get(state)
+                if node is None:
+                    node = added_dict.get(state)
+                if node is None:
+                    node = self.fresh_var(nr_of_states + len(added_dict))
+                    added_dict[state] = node
+                    graph.add_node(node,color=color,**{attribute: state})
+                nodes.append(node)
+
+            graph.add_edge(nodes[0],nodes[1],color=color,label=add[2]["label"])
 
         return nr_of_states + len(added_dict)
 
-    def matched_k_pairs_transitions(self, fsm_1, fsm_2, k_pairs):
-        '''
-        Calculate the set of transitions of the k_pairs which are matched
-        '''
-        edges = []
-        k_pairs = list(k_pairs)
-        for edge1 in fsm_1.edges.data():
-            for edge2 in fsm_2.edges.data():
-                if (edge1[0],edge2[0]) in k_pairs and (edge1[1],edge2[1]) in k_pairs and edge2[2]["label"] == edge1[2]["label"]:
-                    from_state = self.fresh_var(k_pairs.index((edge1[0],edge2[0])))
-                    to_state = self.fresh_var(k_pairs.index((edge1[1],edge2[1])))
-                    edges.append((from_state,to_state,edge2[2]["label"]))
-        return edges
-
     def annotade_graph(self, k_pairs, added, removed, matched):
         '''
         Create a graph with the matched, added and removed transitions
+        The nodes are named by fresh_var with the original state names as ref and upd attributes
         '''
         graph = nx.MultiDiGraph()
         k_pairs = list(k_pairs)
+        # a state in more than one k_pair is mapped to the node of the last pair
+        reference_nodes = {}
+        updated_nodes = {}
         for i in range(0,len(k_pairs)):
-            graph.add_node(self.fresh_var(i))
+            node = self.fresh_var(i)
+            graph.add_node(node, ref=k_pairs[i][0], upd=k_pairs[i][1])
+            reference_nodes[k_pairs[i][0]] = node
+            updated_nodes[k_pairs[i][1]] = node
 
         for i in matched:
             graph.add_edge(i[0],i[1], label=i[2])
 
-        nr_of_states = self.annotade_edges(graph,k_pairs,added,"green",1,len(graph.nodes))
-        self.annotade_edges(graph,k_pairs,removed,"red",0,nr_of_states)
+        nr_of_states = self.annotade_edges(graph,updated_nodes,added,"green",1,len(graph.nodes))
+        self.annotade_edges(graph,reference_nodes,removed,"red",0,nr_of_states)
         return graph
 
     def performance_matrix(self, fsm_1, FP, FN, perfomance_dict):
@@ -471,17 +802,37 @@ class FSMDiff(metaclass=Singleton):
         ''' return basis statistics for the graph '''
         return {"States": len(graph.nodes), "Transitions": len(graph.edges)}
 
-    def logging(self, fsm_1, fsm_2, added, removed, graph, log_dict):
+    def logging(self, fsm_1, fsm_2, added, removed, graph, log_dict, config, statistics):
         ''' add all log information in one dict '''
         self.performance_matrix(fsm_1,added,removed,log_dict)
         log_dict["Reference"] = self.statistics_graph(fsm_1)
         log_dict["Updated"] = self.statistics_graph(fsm_2)
         log_dict["Output"] = self.statistics_graph(graph)
-        log_dict["Outgoing time"] = "%s" % self.out_time
-        log_dict["Incoming time"] = "%s" % self.in_time
-        log_dict["Solver"] = current_solver
-
-    def algorithm(self, fsm_1, fsm_2, k, t, r, matching_pairs = None):
+        log_dict["Outgoing time"] = "%s" % statistics.out_time
+        log_dict["Incoming time"] = "%s" % statistics.in_time
+        log_dict["Scores wall-clock time"] = "%s" % statistics.scores_time
+        log_dict["Solver"] = config.solver
+        if config.solver in ITERATIVE_SOLVERS:
+            log_dict["Outgoing iterations"] = "%s" % statistics.out_iterations
+            log_dict["Incoming iterations"] = "%s" % statistics.in_iterations
+        if statistics.out_construction is not None:
+            log_dict["Outgoing construction time"] = "%s" % statistics.out_construction
+            log_dict["Incoming construction time"] = "%s" % statistics.in_construction
+        if statistics.out_winner is not None:
+            log_dict["Outgoing winner"] = statistics.out_winner
+            log_dict["Incoming winner"] = statistics.in_winner
+        if statistics.cache_hit is not None:
+            log_dict["Scores cache"] = "hit" if statistics.cache_hit else "miss"
+        if statistics.out_changed is not None:
+            log_dict["Outgoing changed states"] = "%s" % statistics.out_changed
+            log_dict["Incoming changed states"] = "%s" % statistics.in_changed
+        if config.live_pairs:
+            log_dict["Outgoing live pairs"] = "%s of %s" % statistics.out_size
+            log_dict["Incoming live pairs"] = "%s of %s" % statistics.in_size
+        if statistics.profiler.enabled:
+            log_dict["Profile"] = json.dumps(statistics.profiler.report())
+
+    def algorithm(self, fsm_1, fsm_2, config = None, statistics = None):
         '''
         Executes the FSM_Diff algorithm
 
@@ -491,73 +842,209 @@ class FSMDiff(metaclass=Singleton):
             actions marked as label in the graph
         fsm_2: nx.MultiDiGraph
             actions marked as label in the graph
-        k: float
-            the k-value of the algorithm
-        t: float
-            the t-value of the algorithm
-        r: float
-            the r-value of the algorithm
-        matching_pair : (str,str), optional
-            a set of pairs that must be considered as match in the result
+        config: DiffConfig, optional
+            the k, t and r values of the algorithm, the matching pairs that must be
+            considered as match in the result and the solver settings
+        statistics: DiffStatistics, optional
+            the measurements are recorded in here, e.g. to profile the run with an instrument.Profiler
+
+        Returns
+        -------
+        DiffResult with the nx.MultiDiGraph with added/removed transitions annotated in the graph,
+        the scores, the k_pairs and the statistics of the run
+        '''
+        if statistics is None:
+            statistics = DiffStatistics()
+        with statistics.profiler.timer("index"):
+            index_1 = TransitionIndex(fsm_1)
+            index_2 = TransitionIndex(fsm_2)
+        return self.run(index_1, index_2, config, statistics)
+
+    def run(self, index_1, index_2, config = None, statistics = None):
+        '''
+        Executes the FSM_Diff algorithm on models that are already indexed,
+        so that a model can be indexed once and used in many diffs
+
+        Parameters:
+        ----------
+        index_1: TransitionIndex
+            index of the reference fsm
+        index_2: TransitionIndex
+            index of the updated fsm
+        config: DiffConfig, optional
+        statistics: DiffStatistics, optional
+
+        Returns
+        -------
+        DiffResult, see algorithm
+        '''
+        if config is None:
+            config = DiffConfig()
+        config = self.resolve_solver(index_1, index_2, config)
+        matching_pairs = config.matching_pairs
+        if not self.check_matching_pairs(index_1.fsm, index_2.fsm, matching_pairs):
+            return DiffResult(nx.MultiDiGraph())
+
+        if statistics is None:
+            statistics = DiffStatistics()
+
+        # line 1
+        systems = None
+        with statistics.profiler.timer("scores"):
+            if config.cache_dir is not None:
+                pairs_to_scores = self.cached_scores(index_1, index_2, config, statistics)
+            elif self.vectorized(config):
+                # keep the systems so that rediff can reuse them
+                start_time = time()
+                systems = self.score_systems(self.encode(index_1, index_2, statistics), config.k, matching_pairs, config, statistics)
+                self.record_scores_time(start_time, config, statistics)
+                pairs_to_scores = self.combine_scores(*systems.scores(), config)
+            else:
+                pairs_to_scores = self.compute_scores(index_1,index_2,config.k, matching_pairs, config, statistics)
+        result = self.diff_from_scores(index_1, index_2, pairs_to_scores, config, statistics)
+        result.systems = systems
+        return result
+
+    def rediff(self, previous, index_1, index_2, config = None, statistics = None):
+        '''
+        Executes the FSM_Diff algorithm against a new version of the updated model,
+        starting from the score systems of a previous diff with the same reference model.
+        Only the rows of the pairs with an updated state of which the transitions changed are rebuilt
+        and the systems are solved with an iterative solver that starts from the previous scores.
+        Falls back to run if the previous diff has no score systems, e.g. with an SMT-solver or the cache
+
+        Parameters:
+        ----------
+        previous: DiffResult
+            result of run or rediff with the same reference model and matching pairs
+        index_1: TransitionIndex
+            index of the reference fsm
+        index_2: TransitionIndex
+            index of the new updated fsm
+        config: DiffConfig, optional
+            the solver is replaced by INCREMENTAL_SOLVER if it is not one of the ITERATIVE_SOLVERS
+        statistics: DiffStatistics, optional
 
         Returns
         -------
-        nx.MultiDiGraph with added/removed transitions annotated in the graph
+        DiffResult, see algorithm
         '''
+        if config is None:
+            config = DiffConfig()
+        old = previous.systems
+        if (old is None or config.cache_dir is not None or not self.vectorized(config)
+                or old.matching_pairs != config.matching_pairs):
+            return self.run(index_1, index_2, config, statistics)
+        if not self.check_matching_pairs(index_1.fsm, index_2.fsm, config.matching_pairs):
+            return DiffResult(nx.MultiDiGraph())
+        if statistics is None:
+            statistics = DiffStatistics()
+        encoded = self.encode(index_1, index_2, statistics)
+        if not same_reference(old.encoded, encoded):
+            return self.run(index_1, index_2, config, statistics)
+        if config.solver not in ITERATIVE_SOLVERS:
+            config = replace(config, solver=INCREMENTAL_SOLVER)
+
+        start_time = time()
+        structures = []
+        for i, out in enumerate((True, False)):
+            with statistics.profiler.timer(("outgoing" if out else "incoming") + " system"):
+                changed = changed_states(old.encoded, encoded, out)
+                statistics.record(out, changed=int(changed.sum()))
+                structures.append(update_structure(old.structures[i], old.encoded, encoded, changed, out, config.matching_pairs))
+        if config.timing:
+            print("%d outgoing and %d incoming changed states of %d" % (statistics.out_changed, statistics.in_changed, len(encoded.states_2)))
+        initial_guess = [transfer_solution(solution, old.encoded, encoded) for solution in old.solutions]
+        systems = self.score_systems(encoded, config.k, config.matching_pairs, config, statistics, initial_guess, structures)
+        self.record_scores_time(start_time, config, statistics)
+
+        result = self.diff_from_scores(index_1, index_2, self.combine_scores(*systems.scores(), config), config, statistics)
+        result.systems = systems
+        return result
+
+    def check_matching_pairs(self, fsm_1, fsm_2, matching_pairs):
+        ''' True if all matching pairs consist of existing states '''
         if matching_pairs is not None:
             for matching_pair in matching_pairs:
                 if (matching_pair[0] not in fsm_1.nodes or matching_pair[1] not in fsm_2.nodes):
                     print("pair: " + matching_pair[0] +  " " +  matching_pair[1] + " does not exists")
-                    return nx.MultiDiGraph()
+                    return False
+        return True
 
-        # line 1
-        pairs_to_scores = self.compute_scores(fsm_1,fsm_2,k, matching_pairs)
+    def cached_scores(self, index_1, index_2, config, statistics):
+        '''
+        Look up the scores in the score cache of config.cache_dir
+        and compute and store them if they are not cached yet
+        '''
+        cache = ScoreCache(config.cache_dir, config.cache_size)
+        key = score_key(index_1.fsm, index_2.fsm, config.k, config.matching_pairs, config)
+        outcome = cache.get(key, index_1.fsm, index_2.fsm)
+        statistics.cache_hit = outcome is not None
+        if outcome is None:
+            outcome = self.compute_direction_scores(index_1, index_2, config.k, config.matching_pairs, config, statistics)
+            cache.put(key, index_1.fsm, index_2.fsm, *outcome)
+        elif config.timing:
+            print("scores loaded from the cache")
+        return self.combine_scores(outcome[0], outcome[1], config)
+
+    def diff_from_scores(self, index_1, index_2, pairs_to_scores, config, statistics):
+        '''
+        Executes the FSM_Diff algorithm from line 2 onwards with scores that are already computed
+
+        Parameters:
+        ----------
+        index_1: TransitionIndex
+            index of the reference fsm
+        index_2: TransitionIndex
+            index of the updated fsm
+        pairs_to_scores: dict
+            A dictionary with the state pairs as key and score as output
+        config: DiffConfig
+            the t and r values of the algorithm and the output settings
+        statistics: DiffStatistics
+            the measurements of the computation of the scores
+
+        Returns
+        -------
+        DiffResult, see algorithm
+        '''
+        fsm_1 = index_1.fsm
+        fsm_2 = index_2.fsm
+        profiler = statistics.profiler
 
         # line 2
-        k_pairs = self.identify_landmarks(pairs_to_scores,t,r)
+        with profiler.timer("landmarks"):
+            k_pairs = self.identify_landmarks(pairs_to_scores,config.t,config.r)
+        profiler.count("landmarks", len(k_pairs))
         # line 3-5
         key = (list(fsm_1.nodes)[0], list(fsm_2.nodes)[0])
         if not k_pairs and pairs_to_scores[key] >= 0:
             k_pairs.add(key)
-        # line 6
-        n_pairs = set()
-        for pair in k_pairs:
-            n_pairs = n_pairs.union(self.surrounding_pairs(fsm_1,fsm_2,pair))
-        for k_p in k_pairs:
-            n_pairs = self.remove_conflicts(n_pairs,k_p)
-
-        # line 7 - 14
-        while n_pairs:
-            while n_pairs:
-                # line 9
-                pair = self.pick_highest(n_pairs,pairs_to_scores)
-                # line 10
-                k_pairs.add(pair)
-                # line 11
-                n_pairs = self.remove_conflicts(n_pairs,pair)
-            # line 13
-            for pair in k_pairs:
-                n_pairs = n_pairs.union(self.surrounding_pairs(fsm_1,fsm_2,pair))
-            for k_p in k_pairs:
-                n_pairs = self.remove_conflicts(n_pairs,k_p)
-
-        if k_pairs_output:
-            write_k_pairs_to_file(k_pairs, output_file)
-
-        added = self.added_transitions(fsm_1,fsm_2,k_pairs)
-        removed = self.removed_transitions(fsm_1,fsm_2,k_pairs)
-        matched = self.matched_k_pairs_transitions(fsm_1,fsm_2,k_pairs)
-        graph = self.annotade_graph(k_pairs,added,removed,matched)
-
-        if logging:
-            self.logging(fsm_1,fsm_2,added,removed,graph,graph.graph)
-
-        if performance and logging:
+        # line 6 - 14
+        with profiler.timer("matching loop"):
+            self.extend_k_pairs(index_1, index_2, k_pairs, pairs_to_scores, profiler)
+        profiler.count("k-pairs", len(k_pairs))
+
+        if config.k_pairs_output:
+            write_k_pairs_to_file(k_pairs, config.output_file)
+
+        with profiler.timer("transition differences"):
+            added, removed, matched = self.transition_differences(index_1,index_2,k_pairs)
+        profiler.count("added transitions", len(added))
+        profiler.count("removed transitions", len(removed))
+        with profiler.timer("annotate"):
+            graph = self.annotade_graph(k_pairs,added,removed,matched)
+
+        if config.logging:
+            with profiler.timer("logging"):
+                self.logging(fsm_1,fsm_2,added,removed,graph,graph.graph,config,statistics)
+
+        if config.performance and config.logging:
             print(graph.graph)
-        elif performance and not logging:
+        elif config.performance and not config.logging:
             log_dict = {}
-            self.logging(fsm_1,fsm_2,added,removed,graph,log_dict)
+            self.logging(fsm_1,fsm_2,added,removed,graph,log_dict,config,statistics)
             print (log_dict)
 
 
-        return graph
+        return DiffResult(graph, pairs_to_scores, k_pairs, statistics)
@@ -0,0 +1,82 @@
+'''Module for generating synthetic models and mutated versions of them'''
+import random
+
+import networkx as nx
+
+
+def generate_model(nr_of_states, alphabet_size, out_degree, seed = 0):
+    '''
+    Generate a random deterministic model, every state has out_degree transitions
+    with different labels, the first to the next state so that the states form a cycle
+    and every state has an incoming transition, the others to random states. The first state is the initial state
+
+    Parameters
+    ----------
+    nr_of_states: int
+    alphabet_size: int
+        number of labels, at least out_degree
+    out_degree: int
+    seed: int
+        the same parameters and seed give the same model
+
+    Returns
+    -------
+    nx.MultiDiGraph with the states s0, s1, ... and the labels l0, l1, ...
+    '''
+    if out_degree > alphabet_size:
+        raise ValueError("out_degree must not be larger than alphabet_size")
+    rng = random.Random(seed)
+    labels = ["l%d" % i for i in range(alphabet_size)]
+    states = ["s%d" % i for i in range(nr_of_states)]
+    model = nx.MultiDiGraph()
+    model.add_nodes_from(states)
+    for i, state in enumerate(states):
+        for j, label in enumerate(rng.sample(labels, out_degree)):
+            model.add_edge(state, states[(i + 1) % nr_of_states] if j == 0 else rng.choice(states), label=label)
+    return model
+
+def mutate_model(model, mutation_rate, seed = 0):
+    '''
+    Copy a model and add, remove or relabel a fraction of its transitions
+
+    Parameters
+    ----------
+    model: nx.MultiDiGraph
+    mutation_rate: float
+        number of mutations as fraction of the number of transitions,
+        every mutation is an added, a removed or a relabelled transition with equal probability
+    seed: int
+
+    Returns
+    -------
+    The mutated nx.MultiDiGraph, the states keep their names.
+    A model without transitions has no labels to add, its copy is returned unchanged
+    '''
+    rng = random.Random(seed)
+    mutated = model.copy()
+    states = list(mutated.nodes)
+    labels = sorted({edge[2]["label"] for edge in model.edges.data()})
+    if not labels:
+        return mutated
+    # the edges are kept in a list, a removed edge is replaced by the last one
+    edges = list(mutated.edges(keys=True))
+    for _ in range(round(mutation_rate * model.number_of_edges())):
+        kind = rng.randrange(3)
+        if kind == 0 or not edges:
+            source, target = rng.choice(states), rng.choice(states)
+            edges.append((source, target, mutated.add_edge(source, target, label=rng.choice(labels))))
+        elif kind == 1:
+            i = rng.randrange(len(edges))
+            mutated.remove_edge(*edges[i])
+            edges[i] = edges[-1]
+            edges.pop()
+        else:
+            source, target, key = rng.choice(edges)
+            label = mutated[source][target][key]["label"]
+            mutated[source][target][key]["label"] = rng.choice([l for l in labels if l != label] or labels)
+    return mutated
+
+def model_pair(nr_of_states, alphabet_size, out_degree, mutation_rate, seed = 0):
+    '''A generated reference model and a mutated updated model'''
+    reference = generate_model(nr_of_states, alphabet_size, out_degree, seed)
+    return reference, mutate_model(reference, mutation_rate, seed + 1)
@@ -0,0 +1,75 @@
+'''Module with the optional per-phase instrumentation of the FSM_Diff algorithm'''
+from contextlib import contextmanager, nullcontext
+import json
+import sys
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is not measured there
+    resource = None
+
+
+def peak_memory():
+    '''Peak resident memory of the process in MB, or None if it cannot be measured'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class Profiler:
+    '''
+    Named timers and counters of one run, a timer adds up the time of every time it is used.
+    Timers are used as: with profiler.timer("landmarks"): ...
+    '''
+    enabled = True
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, name):
+        '''Add the time of the with block to the timer name'''
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0.0) + perf_counter() - start_time
+
+    def count(self, name, value = 1):
+        '''Add value to the counter name'''
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def peak(self, name, value):
+        '''Keep the highest value of the counter name'''
+        self.counters[name] = max(self.counters.get(name, value), value)
+
+    def report(self):
+        '''The timers in seconds, the counters and the peak memory as a dict'''
+        return {"timers": dict(self.timers), "counters": dict(self.counters), "peak memory (MB)": peak_memory()}
+
+    def to_json(self):
+        '''The report as JSON'''
+        return json.dumps(self.report(), indent=2)
+
+class NullProfiler:
+    '''Profiler that records nothing, used when profiling is off so that a measurement is one empty call'''
+    enabled = False
+
+    def timer(self, name):
+        return _NULL_TIMER
+
+    def count(self, name, value = 1):
+        pass
+
+    def peak(self, name, value):
+        pass
+
+    def report(self):
+        return {}
+
+_NULL_TIMER = nullcontext()
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,122 @@
+'''Module with the iterative solvers for the score systems of the FSM_Diff algorithm'''
+import warnings
+
+import numpy as np
+from scipy.sparse import diags, tril, triu
+from scipy.sparse.linalg import bicgstab, gmres, spsolve_triangular, LinearOperator
+
+# number of GMRES iterations after which the Krylov space is restarted, the default of scipy
+GMRES_RESTART = 20
+
+
+def _inverse_diagonal(matrix):
+    '''
+    Inverse of the diagonal of the matrix
+    Rows without a diagonal entry have no transitions at all, their score is kept at 0
+    '''
+    diagonal = matrix.diagonal()
+    inverse = np.zeros(len(diagonal))
+    np.divide(1.0, diagonal, out=inverse, where=diagonal != 0)
+    return inverse
+
+def _residual(matrix, results, x):
+    '''Relative residual of the solution in the infinity norm'''
+    scale = max(np.abs(results).max(initial=0.0), 1.0)
+    return np.abs(results - matrix @ x).max(initial=0.0) / scale
+
+def jacobi(matrix, results, x0, tolerance, max_iterations):
+    '''
+    Jacobi fixed-point iteration, converges because the score system is
+    diagonally dominant for the usual values of k
+
+    GMRES restarts every GMRES_RESTART iterations, both count the iterations of the inner loop
+
+    Returns
+    -------
+    Tuple of the solution and the number of iterations
+    '''
+    inverse = _inverse_diagonal(matrix)
+    remainder = (matrix - diags(matrix.diagonal())).tocsr()
+    x = x0
+    for iteration in range(1, max_iterations + 1):
+        x = inverse * (results - remainder @ x)
+        if _residual(matrix, results, x) <= tolerance:
+            return x, iteration
+    warnings.warn("jacobi did not converge in %d iterations" % max_iterations)
+    return x, max_iterations
+
+def gauss_seidel(matrix, results, x0, tolerance, max_iterations):
+    '''
+    Gauss-Seidel fixed-point iteration, every iteration solves the lower triangular part
+
+    Returns
+    -------
+    Tuple of the solution and the number of iterations
+    '''
+    lower = tril(matrix, format="csr")
+    upper = triu(matrix, k=1, format="csr")
+    # keep rows without transitions solvable, their score stays 0
+    empty = matrix.diagonal() == 0
+    lower = (lower + diags(empty.astype(float))).tocsr()
+    x = x0
+    for iteration in range(1, max_iterations + 1):
+        x = spsolve_triangular(lower, results - upper @ x, lower=True)
+        if _residual(matrix, results, x) <= tolerance:
+            return x, iteration
+    warnings.warn("gauss-seidel did not converge in %d iterations" % max_iterations)
+    return x, max_iterations
+
+def krylov(method, matrix, results, x0, tolerance, max_iterations):
+    '''
+    BiCGSTAB or GMRES with the diagonal of the matrix as preconditioner
+
+    GMRES restarts every GMRES_RESTART iterations, both count the iterations of the inner loop
+
+    Returns
+    -------
+    Tuple of the solution and the number of iterations
+    '''
+    inverse = _inverse_diagonal(matrix)
+    preconditioner = LinearOperator(matrix.shape, matvec=lambda x: inverse * np.ravel(x))
+    iterations = [0]
+    def count(_):
+        iterations[0] += 1
+    if method == "bicgstab":
+        x, info = bicgstab(matrix, results, x0=x0, rtol=tolerance, maxiter=max_iterations, M=preconditioner, callback=count)
+    else:
+        # maxiter of gmres counts restart cycles, the cycles are sized so that at most max_iterations
+        # inner iterations (rounded up to a whole cycle) are done, the callback counts the inner iterations
+        restart = max(1, min(GMRES_RESTART, max_iterations))
+        x, info = gmres(matrix, results, x0=x0, rtol=tolerance, restart=restart, maxiter=-(-max_iterations // restart),
+            M=preconditioner, callback=count, callback_type="pr_norm")
+    if info != 0:
+        warnings.warn("%s did not converge in %d iterations" % (method, max_iterations))
+    return x, iterations[0]
+
+def iterative_solve(method, matrix, results, tolerance, max_iterations, initial_guess = None):
+    '''
+    Solve the score system with one of the ITERATIVE_SOLVERS
+
+    Parameters
+    ----------
+    method: str
+        One of ITERATIVE_SOLVERS
+    matrix: csc_matrix
+    results: np.ndarray
+        right hand side of the system
+    tolerance: float
+        relative residual at which the iteration stops
+    max_iterations: int
+    initial_guess: np.ndarray, optional
+        start vector, for example the scores of a previous run
+
+    Returns
+    -------
+    Tuple of the solution and the number of iterations
+    '''
+    x0 = np.zeros(len(results)) if initial_guess is None else np.asarray(initial_guess, dtype=float)
+    if method == "jacobi":
+        return jacobi(matrix, results, x0, tolerance, max_iterations)
+    if method == "gauss-seidel":
+        return gauss_seidel(matrix, results, x0, tolerance, max_iterations)
+    return krylov(method, matrix, results, x0, tolerance, max_iterations)
@@ -3,57 +3,66 @@ import getopt
 import sys
 import warnings
 
-import networkx as nx
-
-from fsm import FSMDiff, SMT_SOLVERS
+from settings import DiffConfig, SMT_SOLVERS, ITERATIVE_SOLVERS, EXACT_SOLVER, PORTFOLIO_SOLVER, AUTO_SOLVER
 from read_pairs import read_pairs
-import fsm
+from instrument import Profiler, NULL_PROFILER
 import debug
 
 
 def main():
     '''Main function for reading the commandline parameters and execution the FSM_diff algorithm'''
-    k_value = 0.5
-    threshold = 0.2
-    ratio = 1
+    config = DiffConfig()
     matching_file = None
-    reference_model = None
-    updated_model = None
     reference_filename = None
     updated_filename = None
     output_file = "out.dot"
+    profile_file = None
+    self_loops = False
     try:
-        arguments = getopt.getopt(sys.argv[1:],"idelphs:k:t:r:m:o:",["time","debug","equation","log","performance","help","k-pairs","smt","k_value","threshold","ratio","matching-file","ref=", "upd=", "out="])
+        arguments = getopt.getopt(sys.argv[1:],"idelphs:k:t:r:m:o:",["time","debug","equation","log","performance","help","k-pairs","smt","k_value","threshold","ratio","matching-file","ref=", "upd=", "out=", "live", "tol=", "maxiter=", "parallel", "cache=", "cache-size=", "profile=", "self-loops", "portfolio=", "portfolio-stats=", "scc"])
 
         for current_arg, current_val in arguments[0]:
             if current_arg in ("-s", "--smt"):
-                if current_val in SMT_SOLVERS:
-                    fsm.current_solver = current_val
+                if current_val in SMT_SOLVERS or current_val in ITERATIVE_SOLVERS or current_val in ("umfpack", EXACT_SOLVER, PORTFOLIO_SOLVER, AUTO_SOLVER):
+                    config.solver = current_val
                 else:
                     print("invalid smt-solver")
                     return
             elif current_arg in ("-d", "--debug"):
-                fsm.debug = True
+                config.debug = True
             elif current_arg in ("-i", "--time"):
-                fsm.timing = True
+                config.timing = True
             elif current_arg in ("-p", "--performance"):
-                fsm.performance = True
+                config.performance = True
             elif current_arg in ("-l", "--log"):
-                fsm.logging = True
+                config.logging = True
             elif current_arg in ("-k", "--k_value"):
-                k_value = float(current_val)
+                config.k = float(current_val)
             elif current_arg in ("-t", "--threshold"):
-                threshold = float(current_val)
+                config.t = float(current_val)
             elif current_arg in ("-r", "--ratio"):
-                ratio = float(current_val)
+                config.r = float(current_val)
             elif current_arg in ("--k-pairs"):
-                fsm.k_pairs_output = True
+                config.k_pairs_output = True
             elif current_arg in ("-e", "--equation"):
-                fsm.equation = True
+                config.equation = True
+            elif current_arg == "--tol":
+                config.tolerance = float(current_val)
+            elif current_arg == "--maxiter":
+                config.max_iterations = int(current_val)
+            elif current_arg == "--cache":
+                config.cache_dir = current_val
+            elif current_arg == "--cache-size":
+                config.cache_size = int(float(current_val) * 1024 * 1024)
+            elif current_arg == "--parallel":
+                config.parallel = True
+            elif current_arg == "--live":
+                config.live_pairs = True
+            elif current_arg == "--scc":
+                config.scc = True
             elif current_arg in ("-m","--matching-file"):
                 matching_file = current_val
             elif current_arg in ("--ref"):
-                reference_model = nx.drawing.nx_agraph.read_dot(current_val)
                 reference_filename = current_val
             elif current_arg in ("-o", "--out"):
                 if current_val.split(".")[-1] == "dot":
@@ -61,40 +70,66 @@ def main():
                 else:
                     warnings.warn("output file needs to end on .dot, default out.dot is used instead")
             elif current_arg in ("--upd"):
-                updated_model = nx.drawing.nx_agraph.read_dot(current_val)
                 updated_filename = current_val
+            elif current_arg == "--profile":
+                profile_file = current_val
+            elif current_arg == "--self-loops":
+                self_loops = True
+            elif current_arg == "--portfolio":
+                config.portfolio = current_val.split(",")
+                for solver in config.portfolio:
+                    if not (solver in SMT_SOLVERS or solver in ITERATIVE_SOLVERS or solver in ("umfpack", EXACT_SOLVER)):
+                        print("invalid portfolio solver " + solver)
+                        return
+            elif current_arg == "--portfolio-stats":
+                config.portfolio_stats = current_val
             elif current_arg in ("-h", "--help"):
-                print("Usage: main.py --ref=<reference dot model> --upd=<updated dot model> [-l (add logging in out file) -d (print smt) -e (print linear equation output) -i (print time smt takes) -p (performance matrix) -o <output file> -s <smt-solver> -k <k value> -t <threshold value> -r <ratio value> -m <matching file>]")
+                print("Usage: main.py --ref=<reference dot model> --upd=<updated dot model> [-l (add logging in out file) -d (print smt) -e (print linear equation output) -i (print time smt takes) -p (performance matrix) -o <output file> -s <smt-solver> -k <k value> -t <threshold value> -r <ratio value> -m <matching file> --live (only solve the pairs with matched transitions) --tol=<tolerance> --maxiter=<max iterations> (iterative solvers, gmres finishes its restart cycle of 20) --scc (solve the strongly connected blocks of the systems one by one) --parallel (solve outgoing and incoming concurrently) --cache=<score cache directory> --cache-size=<cache size in MB> --profile=<json file> (per-phase timers and counters, - for the terminal) --self-loops (add a self loop to states without incoming transitions) --portfolio=<comma separated solvers> --portfolio-stats=<json file> (portfolio wins per system size)]")
                 print("<smt-solver> options:")
                 for solver in SMT_SOLVERS:
                     print('\t' + solver)
+                print("<iterative solver> options (also with -s):")
+                for solver in ITERATIVE_SOLVERS:
+                    print('\t' + solver)
+                print("-s " + EXACT_SOLVER + " solves the scores exactly over the rationals, -e prints them as fractions")
+                print("-s " + PORTFOLIO_SOLVER + " races the --portfolio solvers (default umfpack and the smt-solvers) and takes the first solution,")
+                print("-s " + AUTO_SOLVER + " uses the solver that won most often for the size in --portfolio-stats, or races them")
                 return
     except getopt.error as err:
         print(str(err))
     debug.debug_file = output_file
-    if (not reference_model or not updated_model):
+    if (not reference_filename or not updated_filename):
         print("Model not set")
         return
 
-    fsm.output_file = output_file.split(".dot")[0] + ".txt"
+    # the algorithm, numpy, scipy and networkx are loaded after the options are read, --help does not need them
+    from fsm import FSMDiff, DiffStatistics
+    from models import read_model
+    from dot import write_dot
+
+    profiler = NULL_PROFILER if profile_file is None else Profiler()
+    with profiler.timer("parse"):
+        reference_model = read_model(reference_filename, self_loops)
+        updated_model = read_model(updated_filename, self_loops)
+
+    config.output_file = output_file.split(".dot")[0] + ".txt"
     
-    matching_pairs = None
     if matching_file is not None:
-        matching_pairs = read_pairs(matching_file)
-
-    for edge in reference_model.edges.data():
-        if not "label" in edge[2]:
-            edge[2]["label"] = ""
-    for edge in updated_model.edges.data():
-        if not "label" in edge[2]:
-            edge[2]["label"] = ""
+        config.matching_pairs = read_pairs(matching_file)
 
-    graph = FSMDiff().algorithm(reference_model,updated_model,k_value,threshold,ratio,matching_pairs)
-    if fsm.logging:
+    graph = FSMDiff().algorithm(reference_model,updated_model,config,DiffStatistics(profiler=profiler)).graph
+    if config.logging:
         for idx,val in {"Reference":reference_filename, "Updated":updated_filename, "Output":output_file}.items():
             graph.graph.setdefault(idx,{})
             graph.graph[idx]["Filename"] = val
-    nx.drawing.nx_agraph.write_dot(graph,output_file)
+    with profiler.timer("write dot"):
+        write_dot(graph,output_file)
+
+    if profile_file == "-":
+        print(profiler.to_json())
+    elif profile_file is not None:
+        with open(profile_file, "w") as f:
+            f.write(profiler.to_json())
 
 if __name__ == "__main__":
     main()
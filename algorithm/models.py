@@ -0,0 +1,33 @@
+'''Module for reading the models from dot files and compact model files'''
+from compact import CompactFSM, COMPACT_EXTENSION
+from dot import read_dot, parse_dot
+
+
+def read_model(file, self_loops = False):
+    '''
+    Read a model from a dot file, transitions without a label get the empty label.
+    Files with the compact extension are loaded as a memory-mapped CompactFSM
+
+    Parameters
+    ----------
+    file: str
+    self_loops: bool
+        add a self loop to every state of a dot model without incoming transitions, see dot.read_dot
+
+    Returns
+    -------
+    nx.MultiDiGraph or CompactFSM
+    '''
+    if file.endswith(COMPACT_EXTENSION):
+        return CompactFSM.load(file)
+    return read_dot(file, self_loops)
+
+def parse_model(text, self_loops = False):
+    '''
+    Read a model from the text of a dot file, transitions without a label get the empty label
+
+    Returns
+    -------
+    nx.MultiDiGraph
+    '''
+    return parse_dot(text, self_loops)
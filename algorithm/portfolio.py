@@ -0,0 +1,203 @@
+'''
+Module for the solver portfolio: every direction is solved by several backends in worker processes at the same time,
+the first solution that passes a residual check against the assembled system is taken and the other workers are stopped
+'''
+import json
+import multiprocessing
+import os
+import tempfile
+from dataclasses import replace
+from multiprocessing.connection import wait
+from time import time
+
+import numpy as np
+from scipy.sparse.linalg import spsolve
+
+from settings import SMT_SOLVERS, ITERATIVE_SOLVERS, EXACT_SOLVER, PORTFOLIO_SOLVER
+from system import score_structure, assemble_system, live_subsystem
+from iterative import iterative_solve
+from exact import exact_solve
+from blocks import block_solve
+
+DEFAULT_PORTFOLIO = ["umfpack"] + SMT_SOLVERS
+# largest residual max|Ax - b| / max(1, max|b|) of an accepted solution
+RESIDUAL_TOLERANCE = 1e-8
+
+
+def is_backend(solver):
+    ''' True if the solver can be raced in a portfolio '''
+    return solver in SMT_SOLVERS or solver in ITERATIVE_SOLVERS or solver in ("umfpack", EXACT_SOLVER)
+
+def solve_backend(backend, encoded, structure, k, out, matching_pairs, config):
+    '''
+    Solve one direction with one backend
+
+    Returns
+    -------
+    np.ndarray of floats with the scores ordered as encoded.pairs()
+    '''
+    if backend in SMT_SOLVERS:
+        # the SMT-solvers build their own formula, fsm is imported here as it imports this module
+        from fsm import smt_direction
+        outcome, _ = smt_direction(encoded, k, out, matching_pairs, config)
+        return np.array([outcome[pair] for pair in encoded.pairs()], dtype=float)
+    if backend == EXACT_SOLVER:
+        return np.array(exact_solve(structure, k)[0], dtype=float)
+    matrix, results = assemble_system(structure, k)
+    if config.live_pairs:
+        matrix, results, live = live_subsystem(matrix, results)
+    if len(results) == 0:
+        solution = np.zeros(0)
+    elif backend in ITERATIVE_SOLVERS:
+        solution = iterative_solve(backend, matrix, results, config.tolerance, config.max_iterations)[0]
+    elif config.scc:
+        solution = block_solve(matrix, results)[0]
+    else:
+        solution = spsolve(matrix, results)
+    if not config.live_pairs:
+        return solution
+    scores = np.zeros(len(structure.denominator))
+    scores[live] = solution
+    return scores
+
+def _worker(connection, backend, encoded, structure, k, out, matching_pairs, config):
+    ''' Solve one direction in a worker process and send (scores, solve time, error) back '''
+    start_time = time()
+    try:
+        scores = solve_backend(backend, encoded, structure, k, out, matching_pairs, config)
+        connection.send((scores, time() - start_time, None))
+    except Exception as err:
+        connection.send((None, time() - start_time, "%s: %s" % (type(err).__name__, err)))
+    finally:
+        connection.close()
+
+def residual(matrix, results, scores):
+    ''' Largest error of the scores in the system, relative to the largest right-hand side '''
+    if len(results) == 0:
+        return 0.0
+    return float(np.max(np.abs(matrix @ scores - results)) / max(1.0, float(np.max(np.abs(results)))))
+
+def race(encoded, k, matching_pairs, config, backends = None):
+    '''
+    Solve the outgoing and incoming systems with every backend in its own process,
+    per direction the first finite solution with a residual of at most RESIDUAL_TOLERANCE is taken
+    and the processes of the other backends of that direction are terminated
+
+    Parameters
+    ----------
+    backends: list(str), optional
+        the raced solvers, DEFAULT_PORTFOLIO if None
+
+    Returns
+    -------
+    Tuple of the outgoing and incoming outcomes, every outcome is a tuple of the scores ordered as encoded.pairs()
+    and a dict with the measurements of the direction for DiffStatistics.record: the winner and its solve time
+
+    Raises
+    ------
+    RuntimeError if no backend solves a direction
+    '''
+    if backends is None:
+        backends = DEFAULT_PORTFOLIO
+    # the workers print nothing, only the winner is reported
+    worker_config = replace(config, debug=False, timing=False, parallel=False)
+    systems = {}
+    running = {}
+    try:
+        for out in (True, False):
+            structure = score_structure(encoded, out, matching_pairs)
+            matrix, results = assemble_system(structure, k)
+            size = (int(np.count_nonzero(results)) if config.live_pairs else len(results), len(results))
+            systems[out] = (matrix, results, size)
+            for backend in backends:
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=_worker, daemon=True,
+                    args=(writer, backend, encoded, structure, k, out, matching_pairs, replace(worker_config, solver=backend)))
+                process.start()
+                writer.close()
+                running[reader] = (out, backend, process)
+
+        outcomes = {}
+        errors = {True: [], False: []}
+        while len(outcomes) < 2:
+            for reader in wait(list(running)):
+                if reader not in running:
+                    # a loser that was stopped in this round
+                    continue
+                out, backend, process = running.pop(reader)
+                try:
+                    scores, solve_time, error = reader.recv()
+                except EOFError:
+                    scores, solve_time, error = None, None, "the worker process stopped"
+                reader.close()
+                process.join()
+                matrix, results, size = systems[out]
+                if error is None and not np.all(np.isfinite(scores)):
+                    # e.g. spsolve on a singular system
+                    error = "%d scores are not finite" % np.count_nonzero(~np.isfinite(scores))
+                elif error is None and not residual(matrix, results, scores) <= RESIDUAL_TOLERANCE:
+                    error = "residual %g" % residual(matrix, results, scores)
+                if error is not None:
+                    errors[out].append(backend + ": " + error)
+                    if not any(task[0] == out for task in running.values()):
+                        raise RuntimeError("no backend of the portfolio solved the %s system: %s"
+                            % ("outgoing" if out else "incoming", "; ".join(errors[out])))
+                    continue
+                outcomes[out] = (scores, {"time": solve_time, "winner": backend, "size": size})
+                for other in [other for other, task in running.items() if task[0] == out]:
+                    _stop(running.pop(other)[2], other)
+    finally:
+        for reader, (_, _, process) in running.items():
+            _stop(process, reader)
+    return outcomes[True], outcomes[False]
+
+def _stop(process, reader):
+    ''' Terminate a worker of a backend that lost the race '''
+    process.terminate()
+    process.join()
+    reader.close()
+
+def size_bucket(nr_of_pairs):
+    ''' The key of the win statistics of a system size, the sizes are grouped per power of two '''
+    return "2^%d" % max(0, nr_of_pairs - 1).bit_length()
+
+def read_wins(path):
+    '''
+    The win statistics of a portfolio statistics file
+
+    Returns
+    -------
+    dict with a size_bucket as key and a dict with the number of wins per backend as value,
+    empty if the file does not exist or cannot be read
+    '''
+    try:
+        with open(path) as f:
+            wins = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return wins if isinstance(wins, dict) else {}
+
+def record_wins(path, nr_of_pairs, winners):
+    ''' Add the winners of one diff to the statistics file, the file is replaced at once '''
+    wins = read_wins(path)
+    bucket = wins.setdefault(size_bucket(nr_of_pairs), {})
+    for winner in winners:
+        bucket[winner] = bucket.get(winner, 0) + 1
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(handle, "w") as f:
+        json.dump(wins, f, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+def best_backend(path, nr_of_pairs, backends = None):
+    '''
+    The backend that won most often for systems of the size of nr_of_pairs, of the given backends,
+    or PORTFOLIO_SOLVER to race them when there are no statistics for the size yet
+    '''
+    if backends is None:
+        backends = DEFAULT_PORTFOLIO
+    bucket = read_wins(path).get(size_bucket(nr_of_pairs), {}) if path is not None else {}
+    candidates = [(bucket[backend], backend) for backend in backends if bucket.get(backend)]
+    if not candidates:
+        return PORTFOLIO_SOLVER
+    return max(candidates, key=lambda candidate: (candidate[0], -backends.index(candidate[1])))[1]
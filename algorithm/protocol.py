@@ -0,0 +1,36 @@
+'''
+Module with the protocol between the diff server and its clients,
+every request and every response is one JSON object on one line
+'''
+import json
+import os
+import tempfile
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "fsm_diff.sock")
+DEFAULT_HOST = "127.0.0.1"
+# the DiffConfig fields a client may set, the other fields print on the terminal of the server
+CONFIG_FIELDS = ("k", "t", "r", "solver", "matching_pairs", "live_pairs", "tolerance", "max_iterations", "parallel", "cache_dir", "cache_size", "scc", "portfolio", "portfolio_stats")
+
+
+def encode_message(message):
+    '''One request or response as a line of JSON'''
+    return json.dumps(message, default=_json_value).encode() + b"\n"
+
+def decode_message(line):
+    '''
+    Read one request or response
+
+    Raises
+    ------
+    ValueError if the line is not a JSON object
+    '''
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError("a message must be a JSON object")
+    return message
+
+def _json_value(value):
+    '''numpy scalars in the log dict become numbers, anything else its string'''
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
@@ -0,0 +1,251 @@
+'''
+Server module for running the FSM_diff algorithm as a long-running local service,
+the models stay parsed and indexed between the requests and the diffs run on a process pool
+'''
+import asyncio
+import getopt
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+from fsm import FSMDiff, DiffStatistics, TransitionIndex
+from settings import DiffConfig, SMT_SOLVERS, ITERATIVE_SOLVERS, EXACT_SOLVER, PORTFOLIO_SOLVER, AUTO_SOLVER
+from models import read_model, parse_model
+from dot import to_dot
+from compact import COMPACT_EXTENSION
+from portfolio import is_backend
+from instrument import Profiler, NULL_PROFILER
+from protocol import DEFAULT_SOCKET, DEFAULT_HOST, CONFIG_FIELDS, encode_message, decode_message
+
+# longest request or response line, inline models can be large
+MAX_MESSAGE = 1024 * 1024 * 1024
+
+_models = OrderedDict()
+_cache_entries = 32
+
+
+def _init_worker(cache_entries):
+    '''Set the number of indexed models every worker process keeps'''
+    global _cache_entries
+    _cache_entries = cache_entries
+    _models.clear()
+
+def _index(key, path, text, self_loops):
+    '''
+    The indexed model of a content hash from the least recently used cache of the worker,
+    the model is parsed from text, or read from path if text is None, when it is not cached.
+    With self_loops a self loop is added to the states without incoming transitions
+
+    Returns
+    -------
+    Tuple of the TransitionIndex and whether it was cached
+    '''
+    index = _models.pop(key, None)
+    cached = index is not None
+    if not cached:
+        index = TransitionIndex(read_model(path, self_loops) if text is None else parse_model(text, self_loops))
+    _models[key] = index
+    while len(_models) > _cache_entries:
+        _models.popitem(last=False)
+    return index, cached
+
+def _diff(reference, updated, config, logging, filenames, profile):
+    '''
+    Run one diff in a worker
+
+    Parameters
+    ----------
+    reference, updated: (str, str, str, bool)
+        content hash, path, dot text and self_loops of the models, see _index
+    config: DiffConfig
+        logging is always enabled, the log dict is returned also when it is not added to the output
+    logging: bool
+        add the log dict to the annotated model, as main.py -l
+    filenames: dict
+        the Filename of the Reference, Updated and Output in the log of the annotated model
+    profile: bool
+        return the per-phase timers and counters
+
+    Returns
+    -------
+    The response with the annotated model as dot text and the log dict
+    '''
+    start_time = time()
+    profiler = Profiler() if profile else NULL_PROFILER
+    with profiler.timer("index"):
+        index_1, cached_1 = _index(*reference)
+        index_2, cached_2 = _index(*updated)
+    graph = FSMDiff().run(index_1, index_2, config, DiffStatistics(profiler=profiler)).graph
+    log = dict(graph.graph)
+    if logging:
+        for idx,val in filenames.items():
+            graph.graph.setdefault(idx,{})
+            graph.graph[idx]["Filename"] = val
+    else:
+        graph.graph.clear()
+    with profiler.timer("write dot"):
+        dot = to_dot(graph)
+    response = {"dot": dot, "log": log, "cached": [cached_1, cached_2], "time": time() - start_time}
+    if profile:
+        response["profile"] = profiler.report()
+    return response
+
+def model_source(request, name):
+    '''
+    The model name ("reference" or "updated") of a request, inline as name + "_dot" or as path
+
+    Returns
+    -------
+    Tuple of the cache key, the path, the dot text and whether self loops are added,
+    the text is None for compact models
+    '''
+    self_loops = bool(request.get("self_loops"))
+    if request.get(name + "_dot") is not None:
+        text = request[name + "_dot"]
+        return _key(text.encode(), self_loops), None, text, self_loops
+    path = request.get(name)
+    if path is None:
+        raise ValueError(name + " model not set")
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(COMPACT_EXTENSION):
+        return _key(data, self_loops), path, None, self_loops
+    return _key(data, self_loops), path, data.decode(), self_loops
+
+def _key(data, self_loops):
+    '''Cache key of a model, the content hash, a model with self loops is another model'''
+    return hashlib.sha256(data).hexdigest() + (":self-loops" if self_loops else "")
+
+def request_config(request):
+    '''
+    The DiffConfig of a request, only the CONFIG_FIELDS can be set
+
+    Raises
+    ------
+    ValueError for other fields or an unknown solver
+    '''
+    values = dict(request.get("config") or {})
+    for name in values:
+        if name not in CONFIG_FIELDS:
+            raise ValueError("invalid config field " + name)
+    solver = values.get("solver", "umfpack")
+    if not (solver in SMT_SOLVERS or solver in ITERATIVE_SOLVERS or solver in ("umfpack", EXACT_SOLVER, PORTFOLIO_SOLVER, AUTO_SOLVER)):
+        raise ValueError("invalid smt-solver " + str(solver))
+    for backend in values.get("portfolio") or []:
+        if not is_backend(backend):
+            raise ValueError("invalid portfolio solver " + str(backend))
+    if values.get("matching_pairs") is not None:
+        values["matching_pairs"] = [tuple(pair) for pair in values["matching_pairs"]]
+    return DiffConfig(**values, logging=True)
+
+class DiffServer:
+    '''
+    Asyncio server that answers diff requests, every connection can send many requests,
+    one JSON line each, and gets one JSON line back per request
+
+    Request: {"reference": path or "reference_dot": dot text, "updated": path or "updated_dot": dot text,
+    "config": {DiffConfig fields}, "logging": bool, "self_loops": bool, "profile": bool, "filenames": {"Reference": .., "Updated": .., "Output": ..}}
+    or {"command": "shutdown"}
+
+    Response: {"dot": annotated model, "log": log dict, "cached": [bool, bool], "time": seconds}
+    or {"error": message}
+    '''
+    def __init__(self, workers = None, cache_entries = 32):
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_entries,))
+        self.stopped = None
+
+    async def handle(self, reader, writer):
+        '''Answer the requests of one connection'''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = decode_message(line)
+                    response = await self.answer(request)
+                except Exception as err:
+                    response = {"error": "%s: %s" % (type(err).__name__, err)}
+                writer.write(encode_message(response))
+                await writer.drain()
+                if response.get("stopped"):
+                    # stop after the response is sent, the connection is closed first
+                    writer.close()
+                    await writer.wait_closed()
+                    self.stopped.set()
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def answer(self, request):
+        '''The response to one request'''
+        command = request.get("command", "diff")
+        if command == "shutdown":
+            return {"stopped": True}
+        if command != "diff":
+            raise ValueError("invalid command " + str(command))
+        loop = asyncio.get_running_loop()
+        config = request_config(request)
+        # hash the models in a thread, the event loop keeps accepting requests
+        reference = await loop.run_in_executor(None, model_source, request, "reference")
+        updated = await loop.run_in_executor(None, model_source, request, "updated")
+        filenames = {"Reference": request.get("reference", "<inline>"), "Updated": request.get("updated", "<inline>")}
+        filenames.update(request.get("filenames") or {})
+        return await loop.run_in_executor(self.executor, _diff, reference, updated, config,
+            bool(request.get("logging")), filenames, bool(request.get("profile")))
+
+    async def serve(self, socket_path = DEFAULT_SOCKET, port = None, host = DEFAULT_HOST):
+        '''Serve on the unix socket, or on host:port when a port is given, until a shutdown request'''
+        self.stopped = asyncio.Event()
+        if port is None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle, path=socket_path, limit=MAX_MESSAGE)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=MAX_MESSAGE)
+        try:
+            async with server:
+                await self.stopped.wait()
+        finally:
+            if port is None and os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.executor.shutdown()
+
+def main():
+    '''Main function for reading the commandline parameters and running the server'''
+    socket_path = DEFAULT_SOCKET
+    port = None
+    workers = None
+    cache_entries = 32
+    try:
+        arguments = getopt.getopt(sys.argv[1:],"hj:",["help","socket=","port=","jobs=","models="])
+
+        for current_arg, current_val in arguments[0]:
+            if current_arg == "--socket":
+                socket_path = current_val
+            elif current_arg == "--port":
+                port = int(current_val)
+            elif current_arg in ("-j", "--jobs"):
+                workers = int(current_val)
+            elif current_arg == "--models":
+                cache_entries = int(current_val)
+            elif current_arg in ("-h", "--help"):
+                print("Usage: server.py [--socket=<unix socket> (default " + DEFAULT_SOCKET + ") --port=<localhost port> (instead of the unix socket) -j <worker processes> --models=<indexed models kept per worker>]")
+                return
+    except getopt.error as err:
+        print(str(err))
+        return
+
+    print("serving on " + (socket_path if port is None else "%s:%d" % (DEFAULT_HOST, port)), file=sys.stderr)
+    try:
+        asyncio.run(DiffServer(workers, cache_entries).serve(socket_path, port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+'''
+Module with the settings of the FSM_Diff algorithm and the names of the solvers,
+it imports no solver so that the command line can be parsed before a solver is loaded
+'''
+from dataclasses import dataclass
+from typing import List, Tuple, Optional
+
+SMT_SOLVERS = ["msat","cvc4","z3","yices"]
+ITERATIVE_SOLVERS = ["jacobi","gauss-seidel","bicgstab","gmres"]
+EXACT_SOLVER = "exact"
+# races the backends of DiffConfig.portfolio, see portfolio.race
+PORTFOLIO_SOLVER = "portfolio"
+# the backend that won the portfolio most often for the size, see portfolio.best_backend
+AUTO_SOLVER = "auto"
+
+
+@dataclass
+class DiffConfig:
+    '''This dataclass holds all settings of one run of the FSM_Diff algorithm'''
+    k: float = 0.5
+    t: float = 0.2
+    r: float = 1
+    matching_pairs: Optional[List[Tuple[str,str]]] = None
+    solver: str = "umfpack"
+    debug: bool = False
+    timing: bool = False
+    performance: bool = False
+    logging: bool = False
+    equation: bool = False
+    output_file: str = "out.txt"
+    k_pairs_output: bool = False
+    live_pairs: bool = False
+    tolerance: float = 1e-10
+    max_iterations: int = 1000
+    parallel: bool = False
+    cache_dir: Optional[str] = None
+    cache_size: int = 256 * 1024 * 1024
+    # solve the umfpack systems per strongly connected component, see blocks.block_solve
+    scc: bool = False
+    # the backends raced by the portfolio solver, portfolio.DEFAULT_PORTFOLIO if None
+    portfolio: Optional[List[str]] = None
+    # json file with the portfolio wins per system size
+    portfolio_stats: Optional[str] = None
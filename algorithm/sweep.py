@@ -0,0 +1,141 @@
+'''Sweep module for running the FSM_diff algorithm for many k, t and r values on one pair of models'''
+import csv
+import getopt
+import sys
+from dataclasses import replace
+from time import time
+
+from fsm import FSMDiff, DiffStatistics, TransitionIndex
+from settings import DiffConfig, SMT_SOLVERS, ITERATIVE_SOLVERS, EXACT_SOLVER
+from system import encode_models, score_structure
+from read_pairs import read_pairs
+from models import read_model
+
+SWEEP_COLUMNS = ["k", "t", "r", "precision", "recall", "f-measure", "Outgoing time", "Incoming time", "Scores wall-clock time", "Matching time"]
+
+
+def parse_values(value):
+    '''Parse a comma separated list of floats'''
+    return [float(v) for v in value.split(",")]
+
+def sweep_scores(index_1, index_2, k_values, config):
+    '''
+    Compute the scores for every k-value
+    The structure of both systems is built once, for every k only the -k couplings
+    are rescaled and the iterative solvers start from the scores of the previous k
+
+    Returns
+    -------
+    Generator of (k, pairs_to_scores, DiffStatistics)
+    '''
+    diff = FSMDiff()
+    if config.solver in SMT_SOLVERS:
+        # the SMT-solvers build their own formula, there is no structure to reuse
+        for k in k_values:
+            statistics = DiffStatistics()
+            yield k, diff.compute_scores(index_1, index_2, k, config.matching_pairs, config, statistics), statistics
+        return
+
+    encoded = encode_models(index_1.fsm, index_2.fsm)
+    pairs = encoded.pairs()
+    structures = [score_structure(encoded, out, config.matching_pairs) for out in (True, False)]
+    previous = [None, None]
+    for k in k_values:
+        statistics = DiffStatistics()
+        start_time = time()
+        for i, out in enumerate((True, False)):
+            previous[i] = diff.linear_equation_solver_vectorized(encoded, k, out, config.matching_pairs, config, statistics, previous[i], structures[i])[1]
+        statistics.scores_time = time() - start_time
+        yield k, diff.combine_scores(dict(zip(pairs, previous[0])), dict(zip(pairs, previous[1])), config), statistics
+
+def sweep(fsm_1, fsm_2, k_values, t_values, r_values, config = None):
+    '''
+    Run the FSM_Diff algorithm for every combination of the k, t and r values
+    The scores are computed once per k-value and reused for every t and r
+
+    Returns
+    -------
+    list with a row of the performance matrix and timings per combination
+    '''
+    if config is None:
+        config = DiffConfig()
+    index_1 = TransitionIndex(fsm_1)
+    index_2 = TransitionIndex(fsm_2)
+    rows = []
+    for k, pairs_to_scores, statistics in sweep_scores(index_1, index_2, sorted(k_values), config):
+        for t in t_values:
+            for r in r_values:
+                run_config = replace(config, k=k, t=t, r=r, logging=True, performance=False)
+                start_time = time()
+                graph = FSMDiff().diff_from_scores(index_1, index_2, pairs_to_scores, run_config, statistics).graph
+                row = {column: graph.graph.get(column) for column in SWEEP_COLUMNS}
+                row.update({"k": k, "t": t, "r": r, "Matching time": time() - start_time})
+                rows.append(row)
+    return rows
+
+def write_rows(f, rows):
+    '''Write the rows of the sweep as csv'''
+    writer = csv.DictWriter(f, fieldnames=SWEEP_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+def main():
+    '''Main function for reading the commandline parameters and running the sweep'''
+    config = DiffConfig()
+    k_values = [config.k]
+    t_values = [config.t]
+    r_values = [config.r]
+    reference_model = None
+    updated_model = None
+    output_file = None
+    try:
+        arguments = getopt.getopt(sys.argv[1:],"hs:k:t:r:m:o:",["help","smt=","k_value=","threshold=","ratio=","matching-file=","ref=","upd=","out=","live","scc","tol=","maxiter="])
+
+        for current_arg, current_val in arguments[0]:
+            if current_arg in ("-s", "--smt"):
+                if current_val in SMT_SOLVERS or current_val in ITERATIVE_SOLVERS or current_val in ("umfpack", EXACT_SOLVER):
+                    config.solver = current_val
+                else:
+                    print("invalid smt-solver")
+                    return
+            elif current_arg in ("-k", "--k_value"):
+                k_values = parse_values(current_val)
+            elif current_arg in ("-t", "--threshold"):
+                t_values = parse_values(current_val)
+            elif current_arg in ("-r", "--ratio"):
+                r_values = parse_values(current_val)
+            elif current_arg in ("-m", "--matching-file"):
+                config.matching_pairs = read_pairs(current_val)
+            elif current_arg == "--ref":
+                reference_model = read_model(current_val)
+            elif current_arg == "--upd":
+                updated_model = read_model(current_val)
+            elif current_arg in ("-o", "--out"):
+                output_file = current_val
+            elif current_arg == "--live":
+                config.live_pairs = True
+            elif current_arg == "--scc":
+                config.scc = True
+            elif current_arg == "--tol":
+                config.tolerance = float(current_val)
+            elif current_arg == "--maxiter":
+                config.max_iterations = int(current_val)
+            elif current_arg in ("-h", "--help"):
+                print("Usage: sweep.py --ref=<reference dot model> --upd=<updated dot model> [-k <k values> -t <threshold values> -r <ratio values> (comma separated) -o <output csv> -s <solver> -m <matching file> --live --scc --tol=<tolerance> --maxiter=<max iterations>]")
+                return
+    except getopt.error as err:
+        print(str(err))
+        return
+    if (not reference_model or not updated_model):
+        print("Model not set")
+        return
+
+    rows = sweep(reference_model, updated_model, k_values, t_values, r_values, config)
+    if output_file is None:
+        write_rows(sys.stdout, rows)
+    else:
+        with open(output_file, "w", newline="") as f:
+            write_rows(f, rows)
+
+if __name__ == "__main__":
+    main()
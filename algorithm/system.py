@@ -0,0 +1,328 @@
+'''Module for building the linear score systems of the FSM_Diff algorithm with NumPy/SciPy'''
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, coo_matrix
+
+from compact import CompactFSM
+
+
+@dataclass
+class EncodedModels:
+    '''Both models with the states and labels interned as integers'''
+    states_1: List[str]
+    states_2: List[str]
+    labels: List[str]
+    src_1: np.ndarray
+    dst_1: np.ndarray
+    label_1: np.ndarray
+    src_2: np.ndarray
+    dst_2: np.ndarray
+    label_2: np.ndarray
+
+    def pairs(self):
+        '''All state pairs in the order of the unknowns of the score system'''
+        return [(s1,s2) for s1 in self.states_1 for s2 in self.states_2]
+
+def _edge_arrays(fsm, state_ids, label_ids):
+    '''Convert the edges of a graph to source, target and label arrays'''
+    src = []
+    dst = []
+    lab = []
+    for edge in fsm.edges.data():
+        src.append(state_ids[edge[0]])
+        dst.append(state_ids[edge[1]])
+        lab.append(label_ids.setdefault(edge[2]["label"], len(label_ids)))
+    return np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64), np.array(lab, dtype=np.int64)
+
+def _compact_arrays(fsm, label_ids):
+    '''Source, target and label arrays of a CompactFSM with its labels mapped to label_ids'''
+    remap = np.array([label_ids.setdefault(label, len(label_ids)) for label in fsm.labels], dtype=np.int64)
+    labels = remap[fsm.label] if len(remap) else np.zeros(0, dtype=np.int64)
+    return fsm.src.astype(np.int64), fsm.dst.astype(np.int64), labels
+
+def encode_models(fsm_1, fsm_2):
+    '''
+    Intern the states of both models and the labels shared by both models
+
+    Parameters
+    ----------
+    fsm_1: nx.MultiDiGraph or CompactFSM
+    fsm_2: nx.MultiDiGraph or CompactFSM
+
+    Returns
+    -------
+    Instance of EncodedModels
+    '''
+    states_1 = list(fsm_1.nodes)
+    states_2 = list(fsm_2.nodes)
+    label_ids = {}
+    if isinstance(fsm_1, CompactFSM) and isinstance(fsm_2, CompactFSM):
+        # the models are already interned, only the labels of both models must be merged
+        src_1, dst_1, label_1 = _compact_arrays(fsm_1, label_ids)
+        src_2, dst_2, label_2 = _compact_arrays(fsm_2, label_ids)
+        return EncodedModels(states_1, states_2, list(label_ids), src_1, dst_1, label_1, src_2, dst_2, label_2)
+    src_1, dst_1, label_1 = _edge_arrays(fsm_1, {s: i for i, s in enumerate(states_1)}, label_ids)
+    src_2, dst_2, label_2 = _edge_arrays(fsm_2, {s: i for i, s in enumerate(states_2)}, label_ids)
+    return EncodedModels(states_1, states_2, list(label_ids), src_1, dst_1, label_1, src_2, dst_2, label_2)
+
+def _one_hot(rows, labels, nr_of_rows, nr_of_labels):
+    '''Sparse matrix with a one at (row, label) for every entry, duplicates are summed'''
+    return csr_matrix((np.ones(len(rows)), (rows, labels)), shape=(nr_of_rows, nr_of_labels))
+
+def allowed_matches(encoded, matching_pairs):
+    '''
+    Vectorized version of FSMDiff.is_a_match
+
+    Returns
+    -------
+    Boolean |S1| x |S2| array which is False for the pairs that are excluded by the matching pairs
+    '''
+    allowed = np.ones((len(encoded.states_1), len(encoded.states_2)), dtype=bool)
+    if matching_pairs is None:
+        return allowed
+    ids_1 = {s: i for i, s in enumerate(encoded.states_1)}
+    ids_2 = {s: i for i, s in enumerate(encoded.states_2)}
+    rows = [ids_1[m1] for m1, _ in matching_pairs]
+    cols = [ids_2[m2] for _, m2 in matching_pairs]
+    allowed[rows, :] = False
+    allowed[:, cols] = False
+    allowed[rows, cols] = True
+    return allowed
+
+@dataclass
+class ScoreStructure:
+    '''
+    The part of a score system that does not depend on k:
+    the denominators, the positions of the -k couplings and the right hand side
+    '''
+    denominator: np.ndarray
+    rows: np.ndarray
+    columns: np.ndarray
+    matched: np.ndarray
+
+def score_structure(encoded, out, matching_pairs = None, subset = None):
+    '''
+    Build the structure of the linear system of the outgoing or incoming scores
+
+    The number of matched transitions of a pair (s1,s2) is the sum over the labels
+    of c1(s1,l) * c2(s2,l), with c the state x label count matrices.
+    Every matched transition couples the pair to the pair of reached states.
+
+    Parameters
+    ----------
+    encoded: EncodedModels
+    out: bool
+        True if it must match on outgoing transitions,
+        False if must match on incoming transitions
+    matching_pairs: list((str,str)), optional
+    subset: np.ndarray, optional
+        indices of updated states, only the rows of the pairs (s1,s2) with s2 in subset are built
+
+    Returns
+    -------
+    Instance of ScoreStructure, the unknowns are ordered as encoded.pairs().
+    With a subset the denominators and right hand side are ordered as (s1, subset[j])
+    '''
+    n1 = len(encoded.states_1)
+    n2 = len(encoded.states_2)
+    nr_of_labels = len(encoded.labels)
+    if out:
+        src_1, dst_1, src_2, dst_2 = encoded.src_1, encoded.dst_1, encoded.src_2, encoded.dst_2
+    else:
+        src_1, dst_1, src_2, dst_2 = encoded.dst_1, encoded.src_1, encoded.dst_2, encoded.src_2
+    label_2 = encoded.label_2
+
+    counts_1 = _one_hot(src_1, encoded.label_1, n1, nr_of_labels)
+    counts_2 = _one_hot(src_2, label_2, n2, nr_of_labels)
+    if subset is not None:
+        counts_2 = counts_2[subset]
+        edges = np.isin(src_2, subset)
+        src_2, dst_2, label_2 = src_2[edges], dst_2[edges], label_2[edges]
+    present_1 = counts_1.sign()
+    present_2 = counts_2.sign()
+    degree_1 = np.asarray(counts_1.sum(axis=1)).ravel()
+    degree_2 = np.asarray(counts_2.sum(axis=1)).ravel()
+
+    matched = (counts_1 @ counts_2.T).toarray()
+    non_matched_1 = degree_1[:, None] - (counts_1 @ present_2.T).toarray()
+    non_matched_2 = degree_2[None, :] - (present_1 @ counts_2.T).toarray()
+    denominator = 2 * (matched + non_matched_1 + non_matched_2)
+
+    # every pair of edges with the same label is a matched transition
+    edge_pairs = (_one_hot(np.arange(len(src_1)), encoded.label_1, len(src_1), nr_of_labels)
+        @ _one_hot(np.arange(len(src_2)), label_2, len(src_2), nr_of_labels).T).tocoo()
+    rows = src_1[edge_pairs.row] * n2 + src_2[edge_pairs.col]
+    columns = dst_1[edge_pairs.row] * n2 + dst_2[edge_pairs.col]
+    allowed = allowed_matches(encoded, matching_pairs).ravel()[columns]
+    return ScoreStructure(denominator.ravel(), rows[allowed], columns[allowed], matched.ravel())
+
+@dataclass
+class ScoreSystems:
+    '''
+    The encoded models with the structures and solutions of the outgoing and incoming score systems,
+    kept in a DiffResult so that a later diff against a new updated model can reuse them
+    '''
+    encoded: EncodedModels
+    matching_pairs: Optional[List[Tuple[str,str]]]
+    structures: List[ScoreStructure]
+    solutions: List[np.ndarray]
+
+    def scores(self):
+        '''Tuple of the outgoing and incoming scores as dicts with the pairs as key'''
+        pairs = self.encoded.pairs()
+        return dict(zip(pairs, self.solutions[0])), dict(zip(pairs, self.solutions[1]))
+
+def same_reference(encoded_1, encoded_2):
+    '''True if both encodings have the same reference model with the same state and label ids'''
+    # the labels of the reference model are interned first
+    nr_of_labels = int(encoded_1.label_1.max()) + 1 if len(encoded_1.label_1) else 0
+    return (encoded_1.states_1 == encoded_2.states_1
+        and encoded_1.labels[:nr_of_labels] == encoded_2.labels[:nr_of_labels]
+        and np.array_equal(encoded_1.src_1, encoded_2.src_1)
+        and np.array_equal(encoded_1.dst_1, encoded_2.dst_1)
+        and np.array_equal(encoded_1.label_1, encoded_2.label_1))
+
+def _transitions_per_state(encoded, out):
+    '''Multiset of (label, reached state) of every updated state'''
+    if out:
+        src, dst = encoded.src_2, encoded.dst_2
+    else:
+        src, dst = encoded.dst_2, encoded.src_2
+    transitions = {state: Counter() for state in encoded.states_2}
+    for s, d, l in zip(src.tolist(), dst.tolist(), encoded.label_2.tolist()):
+        transitions[encoded.states_2[s]][(encoded.labels[l], encoded.states_2[d])] += 1
+    return transitions
+
+def changed_states(old, new, out):
+    '''
+    Find the updated states of which the outgoing or incoming transitions changed
+
+    Parameters
+    ----------
+    old: EncodedModels
+        encoding of the previous diff
+    new: EncodedModels
+        encoding with the new updated model, with the same reference model
+    out: bool
+
+    Returns
+    -------
+    Boolean array over new.states_2 which is True for new states and states with changed transitions
+    '''
+    old_transitions = _transitions_per_state(old, out)
+    new_transitions = _transitions_per_state(new, out)
+    return np.array([old_transitions.get(state) != new_transitions[state] for state in new.states_2], dtype=bool)
+
+def _state_positions(old, new):
+    '''Index in new.states_2 of every state of old.states_2, -1 for removed states'''
+    ids = {state: i for i, state in enumerate(new.states_2)}
+    return np.array([ids.get(state, -1) for state in old.states_2], dtype=np.int64)
+
+def update_structure(structure, old, new, changed, out, matching_pairs = None):
+    '''
+    Update the structure of a previous diff to a new updated model
+
+    The row of a pair (s1,s2) only depends on the transitions of s1 and s2,
+    so the rows of unchanged updated states are moved to their new position
+    and only the rows of the changed states are built
+
+    Parameters
+    ----------
+    structure: ScoreStructure
+        structure of the previous diff
+    old: EncodedModels
+        encoding of the previous diff
+    new: EncodedModels
+        encoding with the new updated model, with the same reference model
+    changed: np.ndarray
+        result of changed_states
+    out: bool
+    matching_pairs: list((str,str)), optional
+        the matching pairs of the previous diff
+
+    Returns
+    -------
+    Instance of ScoreStructure, the unknowns are ordered as new.pairs()
+    '''
+    n1 = len(new.states_1)
+    n2_old = len(old.states_2)
+    n2 = len(new.states_2)
+    positions = _state_positions(old, new)
+    reused = positions >= 0
+    reused[reused] = ~changed[positions[reused]]
+
+    keep = reused[structure.rows % n2_old]
+    rows = structure.rows[keep]
+    columns = structure.columns[keep]
+    rows = rows // n2_old * n2 + positions[rows % n2_old]
+    columns = columns // n2_old * n2 + positions[columns % n2_old]
+
+    denominator = np.zeros((n1, n2))
+    matched = np.zeros((n1, n2))
+    denominator[:, positions[reused]] = structure.denominator.reshape(n1, n2_old)[:, reused]
+    matched[:, positions[reused]] = structure.matched.reshape(n1, n2_old)[:, reused]
+
+    subset = np.flatnonzero(changed)
+    fresh = score_structure(new, out, matching_pairs, subset)
+    denominator[:, subset] = fresh.denominator.reshape(n1, len(subset))
+    matched[:, subset] = fresh.matched.reshape(n1, len(subset))
+    return ScoreStructure(denominator.ravel(), np.concatenate((rows, fresh.rows)),
+        np.concatenate((columns, fresh.columns)), matched.ravel())
+
+def transfer_solution(solution, old, new):
+    '''Order the scores of a previous diff as new.pairs(), the pairs with a new updated state start at 0'''
+    n1 = len(new.states_1)
+    positions = _state_positions(old, new)
+    reused = positions >= 0
+    guess = np.zeros((n1, len(new.states_2)))
+    guess[:, positions[reused]] = np.asarray(solution).reshape(n1, len(old.states_2))[:, reused]
+    return guess.ravel()
+
+def assemble_system(structure, k):
+    '''
+    Assemble the score system for a k-value
+
+    Returns
+    -------
+    Tuple of the csc matrix and the right hand side
+    '''
+    n = len(structure.denominator)
+    diagonal = np.arange(n)
+    values = np.full(len(structure.rows), -k, dtype=float)
+    matrix = coo_matrix((np.concatenate((structure.denominator, values)),
+        (np.concatenate((diagonal, structure.rows)), np.concatenate((diagonal, structure.columns)))), shape=(n, n)).tocsc()
+    return matrix, structure.matched
+
+def live_subsystem(matrix, results):
+    '''
+    Restrict the system to the live pairs, the pairs with at least one matched transition
+
+    A pair without matched transitions has a zero right hand side and no coupled
+    unknowns, so its score is exactly 0 and its column can be dropped from the other rows.
+
+    Returns
+    -------
+    Tuple of the reduced csc matrix, the reduced right hand side and the indices of the live pairs
+    '''
+    live = np.flatnonzero(results)
+    return matrix[live][:, live].tocsc(), results[live], live
+
+def score_matrix(pairs_to_scores):
+    '''
+    Convert the scores of the pairs to a |S1| x |S2| array
+
+    Returns
+    -------
+    Tuple of the reference states, the updated states and the array of the scores
+    '''
+    states_1 = list(dict.fromkeys(pair[0] for pair in pairs_to_scores))
+    states_2 = list(dict.fromkeys(pair[1] for pair in pairs_to_scores))
+    ids_1 = {s: i for i, s in enumerate(states_1)}
+    ids_2 = {s: i for i, s in enumerate(states_2)}
+    scores = np.full((len(states_1), len(states_2)), np.nan)
+    for (s1, s2), score in pairs_to_scores.items():
+        scores[ids_1[s1], ids_2[s2]] = score
+    return states_1, states_2, scores